@@ -0,0 +1,227 @@
+import argparse
+import json
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from Color import Color
+from GameRecord import parse_cell
+from Gomoku import Gomoku, SearchTimeout, BOARD_SIZE, SEARCH_DEPTH
+
+MULTI_PV = 3
+BLACK_MARKS = "xXbB"
+WHITE_MARKS = "oOwW"
+EMPTY_MARKS = ".-_+"
+# Budget fields a position may set for itself, over the command line ones.
+BUDGETS = ["max_depth", "time_limit", "node_limit"]
+
+# The engine of this process, reused while the options stay the same.
+_engine = {}
+
+
+def parse_board(rows):
+    # Rows top to bottom, a character per cell left to right: x is the
+    # column, as in the GUI. Returns the stones and the size they span.
+    if isinstance(rows, str):
+        rows = rows.replace("/", "\n").split()
+    stones = []
+    for y, row in enumerate(rows):
+        for x, mark in enumerate(row):
+            if mark in BLACK_MARKS:
+                stones.append((x, y, Color.BLACK))
+            elif mark in WHITE_MARKS:
+                stones.append((x, y, Color.WHITE))
+            elif mark not in EMPTY_MARKS:
+                raise ValueError(f"unknown board mark {mark!r}")
+    return stones, max([len(rows)] + [len(row) for row in rows])
+
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_moves(moves):
+    # "h8 i9 ..." or [[7, 7], [8, 8], ...], black first and alternating.
+    if isinstance(moves, str):
+        moves = moves.replace(",", " ").split()
+    if not isinstance(moves, list):
+        raise ValueError("moves must be a string or a list")
+    stones = []
+    color = Color.BLACK
+    for move in moves:
+        if isinstance(move, str):
+            x, y = parse_cell(move)
+        elif isinstance(move, list) and len(move) == 2 and all(is_int(value) for value in move):
+            x, y = move
+        else:
+            raise ValueError(f"bad move {move!r}")
+        stones.append((x, y, color))
+        color = Color.WHITE if color == Color.BLACK else Color.BLACK
+    return stones
+
+
+def parse_position(line, number):
+    # A JSON object with "board" or "moves" and optionally "id", "size",
+    # "to_move" and budget fields; or a bare board string or move list.
+    line = line.strip()
+    if line.startswith("{"):
+        position = json.loads(line)
+    elif all(mark in BLACK_MARKS + WHITE_MARKS + EMPTY_MARKS + "/ " for mark in line):
+        position = {"board": line}
+    else:
+        position = {"moves": line}
+    if not isinstance(position, dict):
+        raise ValueError("a position must be a JSON object")
+    position.setdefault("id", number)
+    check_fields(position)
+
+    size = position.get("size")
+    if "board" in position:
+        stones, extent = parse_board(position["board"])
+        size = size or max(extent, BOARD_SIZE)
+    else:
+        stones = parse_moves(position.get("moves", []))
+    position["size"] = size or BOARD_SIZE
+    position["stones"] = [(x, y, color.value) for x, y, color in stones]
+    return position
+
+
+def check_fields(position):
+    # The fields the engine gets, checked here so that a bad one fails its
+    # own line only.
+    size = position.get("size")
+    if size is not None and not (is_int(size) and size > 0):
+        raise ValueError(f"bad size {size!r}")
+    board = position.get("board")
+    if board is not None and not (isinstance(board, str)
+                                  or isinstance(board, list) and all(isinstance(row, str) for row in board)):
+        raise ValueError("board must be a string or a list of rows")
+    to_move = position.get("to_move")
+    if to_move is not None and not (isinstance(to_move, str) and to_move.upper() in ("BLACK", "WHITE")):
+        raise ValueError(f"to_move must be BLACK or WHITE, not {to_move!r}")
+    for name in ("max_depth", "node_limit"):
+        value = position.get(name)
+        if value is not None and not (is_int(value) and value > 0):
+            raise ValueError(f"bad {name} {value!r}")
+    time_limit = position.get("time_limit")
+    if time_limit is not None and not (isinstance(time_limit, (int, float)) and not isinstance(time_limit, bool)
+                                       and time_limit > 0):
+        raise ValueError(f"bad time_limit {time_limit!r}")
+
+
+def engine(options):
+    key = tuple(sorted(options.items()))
+    if _engine.get("key") != key:
+        _engine["game"] = Gomoku(verbose=False, **options)
+        _engine["key"] = key
+    return _engine["game"]
+
+
+def analyse(position, options):
+    # Budgets are set on the engine for every position, so positions with
+    # budgets of their own still share one engine instead of building one
+    # each. Positions are unrelated, so its table is cleared for each one.
+    shared = {name: value for name, value in options.items() if name not in BUDGETS}
+    game = engine(dict(shared, board_size=position["size"]))
+    game.initialize_game()
+    game.max_depth = position.get("max_depth", options.get("max_depth", SEARCH_DEPTH))
+    game.time_limit = position.get("time_limit", options.get("time_limit"))
+    game.node_limit = position.get("node_limit", options.get("node_limit"))
+
+    black = 0
+    for x, y, color in position["stones"]:
+        if not game.in_range(x, y) or not game.is_valid(x, y):
+            return {"id": position["id"], "error": f"bad stone {x},{y}"}
+        game.make_move(x, y, Color(color), initial=True)
+        black += color == Color.BLACK.value
+        if game.game_over:
+            return {"id": position["id"], "error": "game already over"}
+
+    to_move = position.get("to_move")
+    if to_move is None:
+        to_move = Color.WHITE if black > len(position["stones"]) - black else Color.BLACK
+    else:
+        to_move = Color[to_move.upper()]
+    game.player_color = game.get_opposite_color(to_move)
+
+    try:
+        result = game.find_best_move()
+    except SearchTimeout:
+        return {"id": position["id"], "error": "no depth finished within the budget"}
+    alternatives = result.alternatives or [(result.move, result.score)]
+    return {
+        "id": position["id"],
+        "to_move": to_move.name,
+        "best_move": result.move,
+        "score": result.score,
+        "depth": result.depth,
+        "alternatives": [{"move": move, "score": score} for move, score in alternatives],
+        "stats": result.stats.to_dict(),
+    }
+
+
+def positions(stream):
+    for number, line in enumerate(stream):
+        if line.strip():
+            yield number, line
+
+
+def analyse_line(number, line, options):
+    try:
+        return analyse(parse_position(line, number), options)
+    except (ValueError, KeyError, IndexError, TypeError) as error:
+        return {"id": number, "error": str(error)}
+
+
+def run(stream, out, options, workers=1):
+    # Results come out in input order. At most a few positions per worker
+    # are in flight, so memory stays flat however long the input is.
+    def write(result):
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+
+    if workers == 1:
+        for number, line in positions(stream):
+            write(analyse_line(number, line, options))
+        return
+
+    pending = deque()
+    with ProcessPoolExecutor(workers) as pool:
+        for number, line in positions(stream):
+            pending.append(pool.submit(analyse_line, number, line, options))
+            if len(pending) >= 2 * workers:
+                write(pending.popleft().result())
+        while pending:
+            write(pending.popleft().result())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Analyse positions, one per line, and write JSON lines.")
+    parser.add_argument("input", nargs="?", default="-", help="position file, stdin by default")
+    parser.add_argument("--output", default="-", help="result file, stdout by default")
+    parser.add_argument("--multi-pv", type=int, default=MULTI_PV, help="best moves to report with exact scores")
+    parser.add_argument("--max-depth", type=int, default=SEARCH_DEPTH)
+    parser.add_argument("--time-limit", type=float, default=None, help="seconds per position")
+    parser.add_argument("--node-limit", type=int, default=None, help="nodes per position")
+    parser.add_argument("--workers", type=int, default=1, help="positions analysed at once")
+    parser.add_argument("--threat-solver", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--opening-book", action=argparse.BooleanOptionalAction, default=False,
+                        help="answer book positions from the book instead of searching them")
+    parser.add_argument("--search-cache", default=None, help="search cache file shared with other engine processes")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    options = {
+        "multi_pv": args.multi_pv,
+        "max_depth": args.max_depth,
+        "time_limit": args.time_limit,
+        "node_limit": args.node_limit,
+        "threat_solver": args.threat_solver,
+        "opening_book": args.opening_book,
+        "search_cache": args.search_cache,
+    }
+    stream = sys.stdin if args.input == "-" else open(args.input)
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    with stream, out:
+        run(stream, out, options, args.workers)
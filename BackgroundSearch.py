@@ -0,0 +1,59 @@
+import queue
+import threading
+
+# Milliseconds between two looks at the queue of a running search.
+POLL_INTERVAL = 20
+
+
+class BackgroundSearch:
+    # Runs search(progress, cancel) on a worker thread so Tk keeps drawing.
+    # The thread never touches Tk: progress reports and the outcome go
+    # through a queue that the main loop empties with after(), where
+    # on_progress(result) and on_done(result, error) are called. cancel()
+    # sets the event the search checks; a cancelled search reports nothing.
+    def __init__(self, master, search, on_progress=None, on_done=None):
+        self.master = master
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.cancel_event = threading.Event()
+        self.messages = queue.Queue()
+        self.thread = threading.Thread(target=self.run, args=(search,), daemon=True)
+        self.thread.start()
+        self.master.after(POLL_INTERVAL, self.poll)
+
+
+    def run(self, search):
+        try:
+            result = search(lambda progress: self.messages.put(("progress", progress)), self.cancel_event)
+        except Exception as error:
+            self.messages.put(("done", None, error))
+        else:
+            self.messages.put(("done", result, None))
+
+
+    def poll(self):
+        while not self.cancel_event.is_set():
+            try:
+                message = self.messages.get_nowait()
+            except queue.Empty:
+                self.master.after(POLL_INTERVAL, self.poll)
+                return
+            if message[0] == "progress":
+                if self.on_progress is not None:
+                    self.on_progress(message[1])
+            else:
+                if self.on_done is not None:
+                    self.on_done(message[1], message[2])
+                return
+
+
+    def is_running(self):
+        return self.thread.is_alive()
+
+
+    def cancel(self, wait=True):
+        # The search gives up within a few hundred nodes; wait before
+        # touching the game it was searching.
+        self.cancel_event.set()
+        if wait:
+            self.thread.join()
@@ -0,0 +1,88 @@
+from Color import Color
+
+# numpy, once a batch evaluation needs it: importing it takes longer than
+# starting the rest of the engine.
+np = None
+
+OWN_CODE = 1
+EMPTY_CODE = 4
+OPPONENT_CODE = 16
+
+
+def available():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return False
+        np = numpy
+    return True
+
+
+class BatchEvaluator:
+    # evaluate_position for many one-stone continuations of the same board at
+    # once. The board is an int8 array of Color values and every candidate
+    # gets its own copy, so each term of the evaluation is a handful of slice
+    # operations over all of them.
+    def __init__(self, geometry):
+        self.size = geometry.size
+        self.stride = geometry.stride
+        self.proximity = np.array(geometry.proximity, dtype=np.float64).reshape(self.size, self.stride)[:, :self.size]
+        self.integral_proximity = bool(np.all(self.proximity == np.round(self.proximity)))
+
+        # (dx, dy) of count_connected and trio_bonus
+        self.directions = [(0, 1), (1, 0), (1, 1), (-1, 1)]
+
+
+    def board_array(self, board):
+        cells = self.size * self.stride
+        nbytes = (cells + 7) // 8
+        array = np.zeros(cells, dtype=np.int8)
+        for color, mask in ((Color.BLACK, board.black), (Color.WHITE, board.white)):
+            bits = np.unpackbits(np.frombuffer(mask.to_bytes(nbytes, "little"), dtype=np.uint8), bitorder="little")
+            array[bits[:cells].astype(bool)] = color.value
+        return array.reshape(self.size, self.stride)[:, :self.size]
+
+
+    def window(self, boards, dx, dy, offset, reach):
+        # The cells offset steps from every p whose walk of reach steps in
+        # (dx, dy) stays on the board.
+        n = self.size
+        x_start = offset * dx + (reach if dx < 0 else 0)
+        x_stop = x_start + n - reach * abs(dx)
+        y_start = offset * dy
+        y_stop = y_start + n - reach * dy
+        return boards[:, x_start:x_stop, y_start:y_stop]
+
+
+    def evaluate_moves(self, board, moves, color, eval_color, calc_proxi=True):
+        if not moves:
+            return []
+        boards = np.repeat(self.board_array(board)[np.newaxis], len(moves), axis=0)
+        xs, ys = zip(*moves)
+        boards[np.arange(len(moves)), xs, ys] = color.value
+
+        # Own stones count 1, empty cells 4 and the opponent 16, so three
+        # cells hold exactly two own stones and one gap when they sum to 6.
+        codes = np.full(3, OPPONENT_CODE, dtype=np.uint8)
+        codes[eval_color.value] = OWN_CODE
+        codes[Color.NONE.value] = EMPTY_CODE
+        coded = codes[boards]
+        own = coded == OWN_CODE
+
+        scores = np.zeros(len(moves), dtype=np.int64)
+        for dx, dy in self.directions:
+            pairs = self.window(own, dx, dy, 0, 1) & self.window(own, dx, dy, 1, 1)
+            scores += np.count_nonzero(pairs, axis=(1, 2))
+
+            following = self.window(coded, dx, dy, 1, 3) + self.window(coded, dx, dy, 2, 3) + self.window(coded, dx, dy, 3, 3)
+            trios = self.window(own, dx, dy, 0, 3) & (following == 2 * OWN_CODE + EMPTY_CODE)
+            scores += np.count_nonzero(trios, axis=(1, 2))
+
+        if not calc_proxi:
+            return scores.tolist()
+        proximity = (own * self.proximity).sum(axis=(1, 2))
+        if self.integral_proximity:
+            return (scores + proximity.astype(np.int64)).tolist()
+        return (scores + proximity).tolist()
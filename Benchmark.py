@@ -0,0 +1,258 @@
+import argparse
+import json
+import platform
+import random
+import time
+from Color import Color
+from Gomoku import Gomoku
+from Openings import OPENINGS
+from SearchStats import SearchStats
+
+MIDDLE_GAME_SEED = 7
+MIDDLE_GAME_COUNT = 6
+MIDDLE_GAME_STONES = 16
+MINIMAX_DEPTHS = [1, 2, 3]
+# A benchmark regresses when its median is this much slower than before.
+REGRESSION_THRESHOLD = 0.10
+# Calls per sample for the calls too quick to time one by one.
+INNER_CALLS = 100
+
+# Positions a move or two from the end: (stones, player color). The AI
+# plays the other color.
+TACTICAL_POSITIONS = [
+    # AI completes its open four
+    ([(7, 5, Color.WHITE), (7, 6, Color.WHITE), (7, 7, Color.WHITE), (7, 8, Color.WHITE),
+      (6, 6, Color.BLACK), (8, 8, Color.BLACK), (6, 8, Color.BLACK), (9, 9, Color.BLACK)], Color.BLACK),
+    # AI must block a four
+    ([(5, 5, Color.BLACK), (6, 6, Color.BLACK), (7, 7, Color.BLACK), (8, 8, Color.BLACK),
+      (7, 6, Color.WHITE), (6, 7, Color.WHITE), (8, 7, Color.WHITE)], Color.BLACK),
+    # AI must answer an open three
+    ([(7, 6, Color.BLACK), (7, 7, Color.BLACK), (7, 8, Color.BLACK),
+      (6, 6, Color.WHITE), (8, 8, Color.WHITE)], Color.BLACK),
+    # AI has a four-three
+    ([(6, 7, Color.WHITE), (7, 7, Color.WHITE), (8, 7, Color.WHITE), (9, 9, Color.WHITE),
+      (9, 8, Color.WHITE), (9, 6, Color.WHITE), (5, 7, Color.BLACK), (7, 8, Color.BLACK),
+      (8, 8, Color.BLACK), (6, 5, Color.BLACK), (10, 10, Color.BLACK)], Color.BLACK),
+]
+
+
+def nearby_cells(board):
+    # Empty cells within two of a stone, or around the center on an empty
+    # board; worked out here so the corpus stays put when the engine's
+    # candidate moves change.
+    stones = list(board.cells(board.black | board.white)) or [(board.size // 2, board.size // 2)]
+    cells = set()
+    for x, y in stones:
+        for i in range(x - 2, x + 3):
+            for j in range(y - 2, y + 3):
+                if 0 <= i < board.size and 0 <= j < board.size and board.is_empty(i, j):
+                    cells.add((i, j))
+    return sorted(cells)
+
+
+def middle_game_positions():
+    # Random but seeded games inside the candidate area, so the corpus does
+    # not change when the engine's choices do. Moves that would end the game
+    # are skipped.
+    rng = random.Random(MIDDLE_GAME_SEED)
+    positions = []
+    for _ in range(MIDDLE_GAME_COUNT):
+        game = Gomoku(verbose=False)
+        stones = []
+        color = Color.BLACK
+        while len(stones) < MIDDLE_GAME_STONES:
+            x, y = rng.choice(nearby_cells(game.board))
+            if game.simulate_and_test(x, y, color):
+                continue
+            game.make_move(x, y, color, initial=True)
+            stones.append((x, y, color))
+            color = game.get_opposite_color(color)
+        positions.append((stones, color))
+    return positions
+
+
+def corpus():
+    positions = [("opening %d" % i, opening, Color.BLACK) for i, opening in enumerate(OPENINGS)]
+    positions += [("middle %d" % i, stones, player) for i, (stones, player) in enumerate(middle_game_positions())]
+    positions += [("tactical %d" % i, stones, player) for i, (stones, player) in enumerate(TACTICAL_POSITIONS)]
+    return positions
+
+
+def setup(stones, player_color, **options):
+    game = Gomoku(verbose=False, **options)
+    for x, y, color in stones:
+        game.make_move(x, y, color, initial=True)
+    game.player_color = player_color
+    return game
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def report(samples, nodes=None):
+    result = {
+        "samples": len(samples),
+        "mean": sum(samples) / len(samples),
+        "p50": percentile(samples, 0.50),
+        "p90": percentile(samples, 0.90),
+        "p99": percentile(samples, 0.99),
+    }
+    if nodes is not None:
+        result["nodes"] = nodes
+        result["nodes_per_sec"] = nodes / sum(samples)
+    return result
+
+
+def time_calls(call, repeat, inner=1):
+    # One sample is the mean time of inner calls in a row.
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(inner):
+            call()
+        samples.append((time.perf_counter() - start) / inner)
+    return samples
+
+
+def bench_is_winning_move(positions, repeat):
+    samples = []
+    for _, stones, player in positions:
+        game = setup(stones, player)
+        for x, y, color in stones:
+            samples += time_calls(lambda: game.is_winning_move(color, x, y), repeat, INNER_CALLS)
+    return report(samples)
+
+
+def bench_evaluate_position(positions, repeat):
+    samples = []
+    for _, stones, player in positions:
+        game = setup(stones, player)
+        ai_color = game.get_opposite_color(player)
+        samples += time_calls(lambda: game.evaluate_position(ai_color), repeat, INNER_CALLS)
+    return report(samples)
+
+
+def bench_try_basic_best_moves(positions, repeat):
+    samples = []
+    for _, stones, player in positions:
+        game = setup(stones, player)
+        ai_color = game.get_opposite_color(player)
+        samples += time_calls(lambda: game.try_basic_best_moves(ai_color), repeat)
+    return report(samples)
+
+
+def bench_solve_threats(positions, repeat):
+    samples = []
+    for _, stones, player in positions:
+        game = setup(stones, player)
+        ai_color = game.get_opposite_color(player)
+        samples += time_calls(lambda: game.solve_threats(ai_color), repeat)
+    return report(samples)
+
+
+def bench_minimax(positions, depth, repeat):
+    # Every run starts from an empty transposition table and move history.
+    samples = []
+    nodes = 0
+    for _, stones, player in positions:
+        game = setup(stones, player)
+        for _ in range(repeat):
+            game.tt.clear()
+            game.orderer.new_search()
+            game.nodes = 0
+            game.stats = SearchStats(depth)
+            game.root_depth = depth
+            start = time.perf_counter()
+            game.minimax(depth, float('-inf'), float('inf'), True)
+            samples.append(time.perf_counter() - start)
+            nodes += game.nodes
+    return report(samples, nodes)
+
+
+def bench_ai_make_move(positions, repeat, options):
+    samples = []
+    nodes = 0
+    for _, stones, player in positions:
+        for _ in range(repeat):
+            game = setup(stones, player, **options)
+            start = time.perf_counter()
+            result = game.ai_make_move()
+            samples.append(time.perf_counter() - start)
+            nodes += result.nodes
+            game.close()
+    return report(samples, nodes)
+
+
+def run(repeat, options):
+    positions = corpus()
+    results = {
+        "is_winning_move": bench_is_winning_move(positions, repeat),
+        "evaluate_position": bench_evaluate_position(positions, repeat),
+        "try_basic_best_moves": bench_try_basic_best_moves(positions, repeat * 10),
+        "solve_threats": bench_solve_threats(positions, repeat),
+    }
+    for depth in MINIMAX_DEPTHS:
+        results["minimax depth %d" % depth] = bench_minimax(positions, depth, repeat)
+    results["ai_make_move"] = bench_ai_make_move(positions, repeat, options)
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "positions": [name for name, _, _ in positions],
+        "options": options,
+        "results": results,
+    }
+
+
+def compare(old, new, threshold=REGRESSION_THRESHOLD):
+    # (name, old p50, new p50, change) for every benchmark both runs have.
+    rows = []
+    for name, result in new["results"].items():
+        if name in old["results"]:
+            before, after = old["results"][name]["p50"], result["p50"]
+            rows.append((name, before, after, after / before - 1 if before else 0.0))
+    regressions = [row for row in rows if row[3] > threshold]
+    return rows, regressions
+
+
+def print_results(results):
+    for name, result in results["results"].items():
+        line = f"{name:24} p50 {result['p50'] * 1e6:10.1f} us  p90 {result['p90'] * 1e6:10.1f} us  p99 {result['p99'] * 1e6:10.1f} us"
+        if "nodes_per_sec" in result:
+            line += f"  {result['nodes_per_sec']:9.0f} nodes/s"
+        print(line)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Time the engine on a fixed set of positions.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", help="earlier result file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--max-depth", type=int, default=None, help="ai_make_move search depth")
+    parser.add_argument("--time-limit", type=float, default=None, help="ai_make_move time limit")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    options = {}
+    if args.max_depth is not None:
+        options["max_depth"] = args.max_depth
+    if args.time_limit is not None:
+        options["time_limit"] = args.time_limit
+
+    results = run(args.repeat, options)
+    print_results(results)
+    with open(args.output, "w") as out:
+        json.dump(results, out, indent=2)
+
+    if args.compare:
+        with open(args.compare) as old_file:
+            rows, regressions = compare(json.load(old_file), results, args.threshold)
+        for name, before, after, change in rows:
+            flag = "  REGRESSION" if change > args.threshold else ""
+            print(f"{name:24} {before * 1e6:10.1f} -> {after * 1e6:10.1f} us  {change:+7.1%}{flag}")
+        if regressions:
+            raise SystemExit(1)
@@ -0,0 +1,245 @@
+from Color import Color
+from Geometry import geometry
+
+BOARD_SIZE = 15
+
+# Per-window stone counts keep both colors in one int: black in the low three
+# bits, white above them.
+BLACK_UNIT = 1
+WHITE_UNIT = 8
+
+
+class Bitboard:
+    # Every color is one Python int with bit x * stride + y set for each stone.
+    # The stride is one wider than the board, so the extra column stays empty
+    # and shifting a pattern off the end of a row never wraps into the next.
+    def __init__(self, size=BOARD_SIZE):
+        self.geometry = geometry(size)
+        self.size = size
+        self.stride = size + 1
+        self.black = 0
+        self.white = 0
+        self.hash = 0
+
+        self.full = self.geometry.full
+        self.shifts = self.geometry.shifts
+        self.forward_shifts = self.geometry.forward_shifts
+        self.proximity = self.geometry.proximity
+        self.black_keys = self.geometry.black_keys
+        self.white_keys = self.geometry.white_keys
+        self.windows = self.geometry.windows
+        self.window_masks = self.geometry.window_masks
+        self.window_ends = self.geometry.window_ends
+        self.cell_windows = self.geometry.cell_windows
+        self.counts = [0] * len(self.windows)
+
+
+    def index(self, x, y):
+        return x * self.stride + y
+
+
+    def cell(self, index):
+        return divmod(index, self.stride)
+
+
+    def get(self, x, y):
+        bit = 1 << (x * self.stride + y)
+        if self.black & bit:
+            return Color.BLACK
+        if self.white & bit:
+            return Color.WHITE
+        return Color.NONE
+
+
+    def is_empty(self, x, y):
+        return not (self.black | self.white) >> (x * self.stride + y) & 1
+
+
+    def mask(self, color):
+        if color is Color.BLACK:
+            return self.black
+        return self.white
+
+
+    def empty(self):
+        return self.full & ~(self.black | self.white)
+
+
+    def unit(self, color):
+        if color is Color.BLACK:
+            return BLACK_UNIT
+        return WHITE_UNIT
+
+
+    def place(self, x, y, color):
+        index = x * self.stride + y
+        if color is Color.BLACK:
+            self.black |= 1 << index
+            self.hash ^= self.black_keys[index]
+            unit = BLACK_UNIT
+        else:
+            self.white |= 1 << index
+            self.hash ^= self.white_keys[index]
+            unit = WHITE_UNIT
+        counts = self.counts
+        for window in self.cell_windows[index]:
+            counts[window] += unit
+
+
+    def remove(self, x, y):
+        index = x * self.stride + y
+        if self.black >> index & 1:
+            self.black &= ~(1 << index)
+            self.hash ^= self.black_keys[index]
+            unit = BLACK_UNIT
+        elif self.white >> index & 1:
+            self.white &= ~(1 << index)
+            self.hash ^= self.white_keys[index]
+            unit = WHITE_UNIT
+        else:
+            return
+        counts = self.counts
+        for window in self.cell_windows[index]:
+            counts[window] -= unit
+
+
+    def stone_count(self):
+        return (self.black | self.white).bit_count()
+
+
+    def is_full(self):
+        return (self.black | self.white) == self.full
+
+
+    def cells(self, mask):
+        while mask:
+            low = mask & -mask
+            yield divmod(low.bit_length() - 1, self.stride)
+            mask ^= low
+
+
+    def first_cell(self, mask):
+        if not mask:
+            return None, None
+        return divmod((mask & -mask).bit_length() - 1, self.stride)
+
+
+    def stone_windows(self, mask):
+        # The windows through the stones of mask, each once. Scans for
+        # windows holding stones go through these instead of every window
+        # on the board, so they cost the same on any board size.
+        windows = set()
+        cell_windows = self.cell_windows
+        while mask:
+            low = mask & -mask
+            windows.update(cell_windows[low.bit_length() - 1])
+            mask ^= low
+        return windows
+
+
+    def extends_window(self, m, window):
+        # Exactly five: a stone of the same color on either end makes it six.
+        before, after = self.window_ends[window]
+        return (before >= 0 and m >> before & 1) or (after >= 0 and m >> after & 1)
+
+
+    def is_five(self, color, x, y, winning_positions=None):
+        m = self.mask(color)
+        counts = self.counts
+        target = 5 * self.unit(color)
+        for window in self.cell_windows[x * self.stride + y]:
+            if counts[window] == target and not self.extends_window(m, window):
+                if winning_positions is not None:
+                    winning_positions.extend(self.cell(i) for i in self.windows[window])
+                return True
+        return False
+
+
+    def five_points(self, color):
+        # Empty cells where color completes exactly five.
+        m = self.mask(color)
+        e = self.empty()
+        target = 4 * self.unit(color)
+        counts = self.counts
+        points = 0
+        for window in self.stone_windows(m):
+            if counts[window] == target and not self.extends_window(m, window):
+                points |= self.window_masks[window] & e
+        return points
+
+
+    def trio_point(self, window, e):
+        # dangerous_trio looks for three stones in a window with the last cell
+        # empty: _OOO_ answered at its first cell, and O.OO_ or OO.O_ with an
+        # empty cell in front, answered in the gap.
+        cells = self.windows[window]
+        if not e >> cells[4] & 1:
+            return -1
+        if e >> cells[0] & 1:
+            return cells[0]
+        before = self.window_ends[window][0]
+        if before < 0 or not e >> before & 1:
+            return -1
+        if e >> cells[1] & 1:
+            return cells[1]
+        return cells[2]
+
+
+    def trio_points(self, color):
+        e = self.empty()
+        target = 3 * self.unit(color)
+        counts = self.counts
+        points = 0
+        for window in self.stone_windows(self.mask(color)):
+            if counts[window] == target:
+                point = self.trio_point(window, e)
+                if point >= 0:
+                    points |= 1 << point
+        return points
+
+
+    def is_trio_point(self, color, x, y):
+        index = x * self.stride + y
+        e = self.empty()
+        counts = self.counts
+        target = 3 * self.unit(color)
+        for window in self.cell_windows[index]:
+            if counts[window] == target and self.trio_point(window, e) == index:
+                return True
+        return False
+
+
+    def pair_count(self, color):
+        m = self.mask(color)
+        count = 0
+        for s in self.shifts:
+            count += (m & (m >> s)).bit_count()
+        return count
+
+
+    def trio_count(self, color):
+        # Stones followed by two more of their color and one empty cell within
+        # the next three cells, counted once per stone and direction.
+        m = self.mask(color)
+        e = self.empty()
+        count = 0
+        for s in self.forward_shifts:
+            if s > 0:
+                m1, m2, m3 = m >> s, m >> 2 * s, m >> 3 * s
+                e1, e2, e3 = e >> s, e >> 2 * s, e >> 3 * s
+            else:
+                m1, m2, m3 = m << -s, m << -2 * s, m << -3 * s
+                e1, e2, e3 = e << -s, e << -2 * s, e << -3 * s
+            count += (m & ((m1 & m2 & e3) | (m1 & e2 & m3) | (e1 & m2 & m3))).bit_count()
+        return count
+
+
+    def proximity_sum(self, color):
+        total = 0
+        proximity = self.proximity
+        m = self.mask(color)
+        while m:
+            low = m & -m
+            total += proximity[low.bit_length() - 1]
+            m ^= low
+        return total
@@ -0,0 +1,88 @@
+CELL = 30
+STONE_RADIUS = 12
+DOT_RADIUS = 3
+BACKGROUND = "#BF8962"
+
+
+class BoardRenderer:
+    # Keeps the canvas items of the board instead of drawing over them: the
+    # grid lines are drawn once, every cell gets one stone item the first
+    # time a stone lands on it and keeps it for good, and a single red dot is
+    # moved to the last move. Changes are collected and applied in one go
+    # when Tk is next idle, so a move costs a few itemconfigure calls however
+    # long the game has gone on.
+    def __init__(self, master, canvas, size):
+        self.master = master
+        self.canvas = canvas
+        self.size = size
+        self.stones = {}
+        # cell -> (fill, outline, width), or None to hide the stone
+        self.pending = {}
+        self.dot_cell = None
+        self.dot_moved = False
+        self.flush_scheduled = False
+
+        length = size * CELL
+        for i in range(size + 1):
+            canvas.create_line(i * CELL, 0, i * CELL, length, fill="black", tags="grid")
+            canvas.create_line(0, i * CELL, length, i * CELL, fill="black", tags="grid")
+        self.dot = canvas.create_oval(0, 0, 0, 0, fill="red", outline="red", width=2, state="hidden")
+
+
+    def place_stone(self, x, y, color_name):
+        self.pending[(x, y)] = (color_name, "black", 1)
+        self.schedule()
+
+
+    def mark_last(self, x, y):
+        # None for no dot, after an initial stone.
+        self.dot_cell = None if x is None else (x, y)
+        self.dot_moved = True
+        self.schedule()
+
+
+    def highlight(self, cells, color_names):
+        for (x, y), color_name in zip(cells, color_names):
+            self.pending[(x, y)] = (color_name, "red", 3)
+        self.schedule()
+
+
+    def clear(self):
+        for cell in self.stones:
+            self.pending[cell] = None
+        self.mark_last(None, None)
+
+
+    def schedule(self):
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.master.after_idle(self.flush)
+
+
+    def flush(self):
+        self.flush_scheduled = False
+        canvas = self.canvas
+        for (x, y), look in self.pending.items():
+            stone = self.stones.get((x, y))
+            if look is None:
+                if stone is not None:
+                    canvas.itemconfigure(stone, state="hidden")
+                continue
+            fill, outline, width = look
+            if stone is None:
+                cx, cy = x * CELL + CELL // 2, y * CELL + CELL // 2
+                stone = canvas.create_oval(cx - STONE_RADIUS, cy - STONE_RADIUS, cx + STONE_RADIUS, cy + STONE_RADIUS)
+                self.stones[(x, y)] = stone
+                canvas.tag_raise(self.dot)
+            canvas.itemconfigure(stone, fill=fill, outline=outline, width=width, state="normal")
+        self.pending.clear()
+
+        if self.dot_moved:
+            self.dot_moved = False
+            if self.dot_cell is None:
+                canvas.itemconfigure(self.dot, state="hidden")
+            else:
+                x, y = self.dot_cell
+                cx, cy = x * CELL + CELL // 2, y * CELL + CELL // 2
+                canvas.coords(self.dot, cx - DOT_RADIUS, cy - DOT_RADIUS, cx + DOT_RADIUS, cy + DOT_RADIUS)
+                canvas.itemconfigure(self.dot, state="normal")
@@ -0,0 +1,56 @@
+CANDIDATE_RADIUS = 1
+
+# (board size, radius) -> cell -> [(neighbor cell, its bit)]
+_neighborhoods = {}
+
+
+def neighborhoods(geometry, radius):
+    key = (geometry.size, radius)
+    shared = _neighborhoods.get(key)
+    if shared is None:
+        shared = [None] * geometry.cell_count
+        for x, y in geometry.board_cells():
+            cells = []
+            for i in range(x - radius, x + radius + 1):
+                for j in range(y - radius, y + radius + 1):
+                    if geometry.in_range(i, j):
+                        cells.append((geometry.index(i, j), 1 << geometry.index(i, j)))
+            shared[geometry.index(x, y)] = cells
+        _neighborhoods[key] = shared
+    return shared
+
+
+class Candidates:
+    # The cells worth trying: empty ones within radius of a stone, plus the
+    # seed cells, which stay candidates while they are empty. counts[cell]
+    # is how many stones (and seeds) have cell in their neighborhood, and
+    # area has a bit for every cell with a count, so a stone taken back
+    # restores exactly the area from before it was placed.
+    def __init__(self, geometry, radius=CANDIDATE_RADIUS, seeds=()):
+        self.radius = radius
+        self.neighbors = neighborhoods(geometry, radius)
+        self.counts = [0] * geometry.cell_count
+        self.area = 0
+        for cell in seeds:
+            self.counts[cell] += 1
+            self.area |= 1 << cell
+
+
+    def place(self, cell):
+        counts = self.counts
+        for neighbor, bit in self.neighbors[cell]:
+            if not counts[neighbor]:
+                self.area |= bit
+            counts[neighbor] += 1
+
+
+    def remove(self, cell):
+        counts = self.counts
+        for neighbor, bit in self.neighbors[cell]:
+            counts[neighbor] -= 1
+            if not counts[neighbor]:
+                self.area &= ~bit
+
+
+    def mask(self, occupied):
+        return self.area & ~occupied
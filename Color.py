@@ -0,0 +1,7 @@
+from enum import Enum
+
+
+class Color(Enum):
+    NONE = 0
+    BLACK = 1
+    WHITE = 2
@@ -0,0 +1,138 @@
+from Color import Color
+
+MAX_CACHED_LINES = 1 << 20
+
+# board size -> {black bits | white bits | playable bits of a line: (black score, white score)}
+_line_scores = {}
+
+
+def line_score(own, empty):
+    # count_connected and trio_bonus summed over the stones of one line; bit
+    # i + 1 is the next cell in the direction those helpers walk.
+    pairs = (own & (own >> 1)).bit_count()
+    o1, o2, o3 = own >> 1, own >> 2, own >> 3
+    e1, e2, e3 = empty >> 1, empty >> 2, empty >> 3
+    trios = (own & ((o1 & o2 & e3) | (o1 & e2 & o3) | (e1 & o2 & o3))).bit_count()
+    return pairs + trios
+
+
+class Evaluator:
+    # Keeps evaluate_position up to date move by move. Every row, column and
+    # diagonal is one small int (a bit per cell for black, then for white)
+    # with a cached score, so a move only rescores the four lines through it.
+    # Search takes stones back in reverse order, so place() remembers what it
+    # overwrote and remove() of the last stone just restores it. A history
+    # entry is (cell, overwritten line scores, line totals before the stone,
+    # proximity totals including it).
+    def __init__(self, geometry, max_cached_lines=MAX_CACHED_LINES):
+        self.size = geometry.size
+        # the cache is shared by every Evaluator of the size; one with a
+        # lower cap clears it sooner
+        self.max_cached_lines = max_cached_lines
+        self.stride = geometry.stride
+        self.proximity = geometry.proximity
+        self.cell_lines = geometry.cell_lines
+        self.valid_keys = [valid << (2 * self.size) for valid in geometry.line_valid]
+        line_count = geometry.line_count
+
+        self.cache = _line_scores.setdefault(self.size, {})
+        self.lines = [0] * line_count
+        self.black_line_scores = [0] * line_count
+        self.white_line_scores = [0] * line_count
+        self.black_score = 0
+        self.white_score = 0
+        self.history = []
+
+
+    def score(self, color, calc_proxi=True):
+        if color is Color.BLACK:
+            return self.black_score + self.black_proximity() if calc_proxi else self.black_score
+        return self.white_score + self.white_proximity() if calc_proxi else self.white_score
+
+
+    def black_proximity(self):
+        return self.history[-1][4] if self.history else 0
+
+
+    def white_proximity(self):
+        return self.history[-1][5] if self.history else 0
+
+
+    def place(self, x, y, color):
+        cell = x * self.stride + y
+        shift = 0 if color is Color.BLACK else self.size
+        lines = self.lines
+        valid_keys = self.valid_keys
+        cache = self.cache
+        black_line_scores = self.black_line_scores
+        white_line_scores = self.white_line_scores
+
+        overwritten = []
+        black_score, white_score = self.black_score, self.white_score
+        for line, bit in self.cell_lines[cell]:
+            content = lines[line] | (bit << shift)
+            lines[line] = content
+            scores = cache.get(content | valid_keys[line])
+            if scores is None:
+                scores = self.line_scores(content | valid_keys[line])
+            old_black, old_white = black_line_scores[line], white_line_scores[line]
+            overwritten.append((line, bit, old_black, old_white))
+            black_score += scores[0] - old_black
+            white_score += scores[1] - old_white
+            black_line_scores[line], white_line_scores[line] = scores
+
+        black_proximity, white_proximity = self.black_proximity(), self.white_proximity()
+        if shift:
+            white_proximity += self.proximity[x * self.stride + y]
+        else:
+            black_proximity += self.proximity[x * self.stride + y]
+        self.history.append((cell, overwritten, self.black_score, self.white_score, black_proximity, white_proximity))
+        self.black_score, self.white_score = black_score, white_score
+
+
+    def remove(self, x, y):
+        cell = x * self.stride + y
+        lines = self.lines
+        shift = self.size
+        if self.history and self.history[-1][0] == cell:
+            _, overwritten, self.black_score, self.white_score, _, _ = self.history.pop()
+            for line, bit, black_score, white_score in overwritten:
+                lines[line] &= ~(bit | bit << shift)
+                self.black_line_scores[line] = black_score
+                self.white_line_scores[line] = white_score
+            return
+
+        # Out of order: rescore the lines and rebuild the proximity totals.
+        for line, bit in self.cell_lines[cell]:
+            lines[line] &= ~(bit | bit << shift)
+            scores = self.line_scores(lines[line] | self.valid_keys[line])
+            self.black_score += scores[0] - self.black_line_scores[line]
+            self.white_score += scores[1] - self.white_line_scores[line]
+            self.black_line_scores[line], self.white_line_scores[line] = scores
+        self.rebuild_history()
+
+
+    def rebuild_history(self):
+        black_proximity = white_proximity = 0
+        for x in range(self.size):
+            line = self.cell_lines[x * self.stride][0][0]
+            for y in range(self.size):
+                if self.lines[line] >> y & 1:
+                    black_proximity += self.proximity[x * self.stride + y]
+                elif self.lines[line] >> (y + self.size) & 1:
+                    white_proximity += self.proximity[x * self.stride + y]
+        self.history = [(-1, [], self.black_score, self.white_score, black_proximity, white_proximity)]
+
+
+    def line_scores(self, key):
+        scores = self.cache.get(key)
+        if scores is None:
+            if len(self.cache) >= self.max_cached_lines:
+                self.cache.clear()
+            size = self.size
+            black = key & ((1 << size) - 1)
+            white = (key >> size) & ((1 << size) - 1)
+            empty = (key >> (2 * size)) & ~(black | white)
+            scores = (line_score(black, empty), line_score(white, empty))
+            self.cache[key] = scores
+        return scores
@@ -0,0 +1,13 @@
+class GameObserver:
+    # What a Gomoku game reports about moves actually played. Search moves are
+    # never reported. Subclasses override the events they care about.
+    def move_made(self, x, y, color, initial):
+        pass
+
+
+    def game_won(self, color, winning_cells):
+        pass
+
+
+    def game_drawn(self):
+        pass
@@ -0,0 +1,237 @@
+import argparse
+import struct
+import sys
+from Bitboard import Bitboard
+from Color import Color
+from GameObserver import GameObserver
+
+RECORD_MAGIC = b"GRC1"
+# magic, board size, initial stones, colors of the initial stones (bit i set
+# when stone i is white), result, player color, moves after the initial stones
+HEADER = struct.Struct("<4sBBHBBH")
+MAX_INITIAL = 16
+# result byte: a winning Color's value, or one of these
+UNFINISHED = 0
+DRAW = 3
+ARCHIVE_PATH = "games.grc"
+COLUMNS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def cell_width(size):
+    # Bytes per move: one while every cell fits in a byte.
+    return 1 if size * size <= 256 else 2
+
+
+def side_to_move(moves):
+    black = sum(1 for _, _, color in moves if color == Color.BLACK)
+    return Color.WHITE if black > len(moves) - black else Color.BLACK
+
+
+def opposite(color):
+    return Color.WHITE if color == Color.BLACK else Color.BLACK
+
+
+def column_name(x):
+    # a to z, then aa, ab and on, for boards wider than 26
+    name = ""
+    x += 1
+    while x:
+        x, letter = divmod(x - 1, len(COLUMNS))
+        name = COLUMNS[letter] + name
+    return name
+
+
+def cell_name(x, y):
+    return f"{column_name(x)}{y + 1}"
+
+
+def parse_cell(name):
+    letters = name.rstrip("0123456789")
+    if not letters or letters.strip(COLUMNS):
+        raise ValueError(f"bad column in {name!r}")
+    if letters == name:
+        raise ValueError(f"no row in {name!r}")
+    x = 0
+    for letter in letters:
+        x = x * len(COLUMNS) + COLUMNS.index(letter) + 1
+    return x - 1, int(name[len(letters):]) - 1
+
+
+class GameRecord:
+    # A finished or unfinished game: the initial stones with their colors,
+    # then the moves played, which alternate from the side to move after
+    # the initial stones. That makes one byte per move enough on the file,
+    # after a fixed header.
+    def __init__(self, size, moves, initial, result=UNFINISHED, player_color=Color.BLACK):
+        self.size = size
+        self.moves = moves
+        self.initial = initial
+        self.result = result
+        self.player_color = player_color
+
+
+    @classmethod
+    def from_game(cls, game, result=None):
+        history = game.history
+        initial = 0
+        while initial < len(history) and history[initial][3]:
+            initial += 1
+        moves = [(x, y, color) for x, y, color, _ in history]
+        if result is None:
+            result = UNFINISHED
+            if game.game_over and moves:
+                x, y, color = moves[-1]
+                result = color.value if game.board.is_five(color, x, y) else DRAW
+        return cls(game.board.size, moves, initial, result, game.player_color)
+
+
+    def encode(self):
+        if self.initial > MAX_INITIAL:
+            raise ValueError(f"at most {MAX_INITIAL} initial stones")
+        colors = 0
+        for i, (_, _, color) in enumerate(self.moves[:self.initial]):
+            if color == Color.WHITE:
+                colors |= 1 << i
+        color = side_to_move(self.moves[:self.initial])
+        for x, y, move_color in self.moves[self.initial:]:
+            if move_color != color:
+                raise ValueError(f"{cell_name(x, y)} is not {color.name}'s move")
+            color = opposite(color)
+
+        width = cell_width(self.size)
+        header = HEADER.pack(RECORD_MAGIC, self.size, self.initial, colors, self.result,
+                             self.player_color.value, len(self.moves) - self.initial)
+        return header + b"".join((x * self.size + y).to_bytes(width, "little") for x, y, _ in self.moves)
+
+
+    @classmethod
+    def decode(cls, header, body):
+        magic, size, initial, colors, result, player_color, count = HEADER.unpack(header)
+        if magic != RECORD_MAGIC:
+            raise ValueError("not a game record")
+        width = cell_width(size)
+        moves = []
+        for i in range(initial + count):
+            x, y = divmod(int.from_bytes(body[i * width:(i + 1) * width], "little"), size)
+            if i < initial:
+                color = Color.WHITE if colors >> i & 1 else Color.BLACK
+            elif i == initial:
+                color = side_to_move(moves)
+            else:
+                color = opposite(color)
+            moves.append((x, y, color))
+        return cls(size, moves, initial, result, Color(player_color))
+
+
+    def result_name(self):
+        if self.result == UNFINISHED:
+            return "UNFINISHED"
+        if self.result == DRAW:
+            return "DRAW"
+        return Color(self.result).name
+
+
+    def to_text(self):
+        def names(moves):
+            return " ".join(f"{color.name[0]}{cell_name(x, y)}" for x, y, color in moves)
+        return "\n".join([
+            f"size {self.size}",
+            f"player {self.player_color.name}",
+            f"result {self.result_name()}",
+            f"initial {names(self.moves[:self.initial])}",
+            f"moves {names(self.moves[self.initial:])}",
+        ])
+
+
+    @classmethod
+    def from_text(cls, text):
+        fields = {}
+        for line in text.strip().splitlines():
+            name, _, value = line.partition(" ")
+            fields[name] = value.split()
+
+        def moves(names):
+            return [(*parse_cell(name[1:]), Color.BLACK if name[0] == "B" else Color.WHITE) for name in names]
+        initial = moves(fields.get("initial", []))
+        result = fields["result"][0]
+        if result in ("UNFINISHED", "DRAW"):
+            result = UNFINISHED if result == "UNFINISHED" else DRAW
+        else:
+            result = Color[result].value
+        return cls(int(fields["size"][0]), initial + moves(fields.get("moves", [])), len(initial),
+                   result, Color[fields["player"][0]])
+
+
+    def positions(self):
+        # (board, move) before every move, on one Bitboard that is updated
+        # in place between steps: copy what has to outlive the step.
+        board = Bitboard(self.size)
+        for x, y, color in self.moves:
+            yield board, (x, y, color)
+            board.place(x, y, color)
+
+
+    def final_board(self):
+        board = Bitboard(self.size)
+        for x, y, color in self.moves:
+            board.place(x, y, color)
+        return board
+
+
+def write_records(path, records, append=True):
+    with open(path, "ab" if append else "wb") as out:
+        for record in records:
+            out.write(record.encode())
+
+
+def read_records(path):
+    # One record at a time, so archives of any size stream in constant memory.
+    with open(path, "rb") as stream:
+        yield from iter_records(stream)
+
+
+def iter_records(stream):
+    while True:
+        header = stream.read(HEADER.size)
+        if not header:
+            return
+        if len(header) < HEADER.size:
+            raise ValueError("truncated game record")
+        _, size, initial, _, _, _, count = HEADER.unpack(header)
+        length = (initial + count) * cell_width(size)
+        body = stream.read(length)
+        if len(body) < length:
+            raise ValueError("truncated game record")
+        yield GameRecord.decode(header, body)
+
+
+class GameArchive(GameObserver):
+    # Appends every game that ends to a record file.
+    def __init__(self, game, path=ARCHIVE_PATH):
+        self.game = game
+        self.path = path
+
+
+    def game_won(self, color, winning_cells):
+        write_records(self.path, [GameRecord.from_game(self.game, color.value)])
+
+
+    def game_drawn(self):
+        write_records(self.path, [GameRecord.from_game(self.game, DRAW)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert game records between binary and text.")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("input", help="record file to export, or text file to import ('-' for stdin)")
+    parser.add_argument("output", nargs="?", help="record file to import into; export prints to stdout")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        for record in read_records(args.input):
+            print(record.to_text())
+            print()
+    else:
+        text = sys.stdin.read() if args.input == "-" else open(args.input).read()
+        games = [game for game in text.split("\n\n") if game.strip()]
+        write_records(args.output or ARCHIVE_PATH, (GameRecord.from_text(game) for game in games))
@@ -0,0 +1,109 @@
+import random
+
+ZOBRIST_SEED = 20240615
+WINDOW = 5
+# The proximity bonus is 2 ** PROXIMITY_RANGE at the center of boards from
+# 15x15 up and halves with every step away, so evaluation keeps its scale on
+# larger boards.
+PROXIMITY_RANGE = 7
+
+_geometries = {}
+
+
+def geometry(size):
+    shared = _geometries.get(size)
+    if shared is None:
+        shared = _geometries[size] = Geometry(size)
+    return shared
+
+
+class Geometry:
+    # Tables that only depend on the board size. They are built once per size
+    # and shared by every board, evaluator and search. A cell is addressed by
+    # its bit index x * stride + y, see Bitboard.
+    def __init__(self, size):
+        self.size = size
+        self.stride = size + 1
+        self.cell_count = size * self.stride
+
+        self.full = 0
+        for x in range(size):
+            self.full |= ((1 << size) - 1) << (x * self.stride)
+
+        # (dx, dy) -> bit shift of one step, in the order used by the win check
+        self.directions = [(1, 0), (0, 1), (1, 1), (1, -1)]
+        self.shifts = [self.stride, 1, self.stride + 1, self.stride - 1]
+        # count_connected and trio_bonus used to walk (0, 1), (1, 0), (1, 1), (-1, 1)
+        self.forward_shifts = [1, self.stride, self.stride + 1, -(self.stride - 1)]
+
+        center = size // 2
+        reach = min(center, PROXIMITY_RANGE)
+        self.proximity = [0] * self.cell_count
+        for x, y in self.board_cells():
+            distance_from_center = abs(x - center) + abs(y - center)
+            self.proximity[self.index(x, y)] = 2 ** (reach - distance_from_center)
+
+        # Seeded, so a position hashes the same in every process and run.
+        rng = random.Random(ZOBRIST_SEED + size)
+        self.black_keys = [rng.getrandbits(64) for _ in range(self.cell_count)]
+        self.white_keys = [rng.getrandbits(64) for _ in range(self.cell_count)]
+
+        self.build_windows()
+        self.build_lines()
+
+
+    def index(self, x, y):
+        return x * self.stride + y
+
+
+    def in_range(self, x, y):
+        return 0 <= x < self.size and 0 <= y < self.size
+
+
+    def board_cells(self):
+        for x in range(self.size):
+            for y in range(self.size):
+                yield x, y
+
+
+    def build_windows(self):
+        # Every run of five cells, grouped by direction in the order of
+        # self.directions, with the cells just before and after it (-1 when
+        # off the board) for the exactly-five rule.
+        self.windows = []
+        self.window_masks = []
+        self.window_ends = []
+        self.cell_windows = [[] for _ in range(self.cell_count)]
+        for dx, dy in self.directions:
+            for x, y in self.board_cells():
+                if not self.in_range(x + (WINDOW - 1) * dx, y + (WINDOW - 1) * dy):
+                    continue
+                cells = tuple(self.index(x + k * dx, y + k * dy) for k in range(WINDOW))
+                before = self.index(x - dx, y - dy) if self.in_range(x - dx, y - dy) else -1
+                after_x, after_y = x + WINDOW * dx, y + WINDOW * dy
+                after = self.index(after_x, after_y) if self.in_range(after_x, after_y) else -1
+
+                window = len(self.windows)
+                self.windows.append(cells)
+                self.window_masks.append(sum(1 << cell for cell in cells))
+                self.window_ends.append((before, after))
+                for cell in cells:
+                    self.cell_windows[cell].append(window)
+
+
+    def build_lines(self):
+        # Rows, columns and both diagonals for the Evaluator: cell -> four
+        # (line, bit) pairs, where bit i + 1 is the next cell in the direction
+        # of forward_shifts.
+        size = self.size
+        first_line = [0, size, 2 * size, 4 * size - 1]
+        self.line_count = 6 * size - 2
+        self.line_valid = [0] * self.line_count
+        self.cell_lines = [None] * self.cell_count
+        for x, y in self.board_cells():
+            lines = []
+            for d, (line, pos) in enumerate([(x, y), (y, x), (x - y + size - 1, x), (x + y, y)]):
+                line += first_line[d]
+                self.line_valid[line] |= 1 << pos
+                lines.append((line, 1 << pos))
+            self.cell_lines[self.index(x, y)] = lines
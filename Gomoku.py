@@ -1,325 +1,916 @@
-import tkinter as tk
-from tkinter import ttk
-from GomokuGUI import GomokuGUI
-from GomokuGUI import Color
+import time
+from collections import namedtuple
+from Color import Color
+from SearchStats import SearchStats
+from ThreatSolver import ThreatSolver
+from Bitboard import Bitboard
+from Candidates import Candidates, CANDIDATE_RADIUS, neighborhoods
+from OpeningBook import OpeningBook
+from SearchCache import SearchCache, CACHE_MIN_DEPTH, option_key
+from Evaluator import Evaluator, MAX_CACHED_LINES
+from MCTS import MCTS, MCTS_ITERATIONS
+from MoveOrderer import MoveOrderer
+import BatchEvaluator
+from TranspositionTable import TranspositionTable, TT_SIZE, EXACT, LOWER, UPPER
 
 BOARD_SIZE = 15
+# Plies searched by ai_make_move: the AI move itself plus minimax(2).
+SEARCH_DEPTH = 3
+# Searches check the clock and node limit every this many nodes.
+BUDGET_CHECK_INTERVAL = 256
+CANCEL_POLL_INTERVAL = 0.05
+
+# Mixed into the board hash so that the same stones are stored separately
+# for each side to move and for either AI color.
+MAXIMIZING_KEY = 0x9E3779B97F4A7C15
+WHITE_AI_KEY = 0xC2B2AE3D27D4EB4F
+
+ENGINES = ["minimax", "mcts"]
+
+# alternatives: the multi_pv best (move, score) pairs, when multi_pv > 1
+SearchResult = namedtuple("SearchResult", ["move", "score", "depth", "nodes", "time", "stats", "alternatives"],
+                          defaults=[None, None])
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+# State of a root search worker process: the bounds and node count shared
+# with the other workers and the last position it loaded, reused while its
+# key matches.
+_worker_state = {}
+
+
+def init_search_worker(shared_bounds, shared_nodes):
+    _worker_state["shared_bounds"] = shared_bounds
+    _worker_state["shared_nodes"] = shared_nodes
+
+
+def search_root_move_worker(snapshot, move, depth, generation, deadline, node_limit):
+    key = (snapshot["hash"], snapshot["player_color"])
+    game = _worker_state.get("game")
+    if game is None or _worker_state.get("key") != key:
+        game = Gomoku.from_snapshot(snapshot)
+        _worker_state["game"] = game
+        _worker_state["key"] = key
+
+    # generation tells this iteration's best score apart from older ones
+    shared_bounds = _worker_state["shared_bounds"]
+    with shared_bounds.get_lock():
+        alpha = shared_bounds[1] if shared_bounds[0] == generation else float('-inf')
+
+    game.nodes = 0
+    game.stats = SearchStats(depth)
+    hits = game.tt.hits
+    cache_hits = 0
+    if game.cache is not None:
+        game.cache.join_search()
+        cache_hits = game.cache.hits
+    game.deadline = None
+    if deadline is not None:
+        game.deadline = time.perf_counter() + deadline - time.time()
+    # node_limit is for the nodes of all workers together
+    game.budget_nodes = node_limit
+    game.node_counter = None
+    if node_limit is not None:
+        game.node_counter = _worker_state["shared_nodes"]
+        game.counted_nodes = 0
+    if game.deadline is not None or node_limit is not None:
+        game.next_budget_check = 1
+    if game.timing:
+        game.start_timing()
+    try:
+        score = game.search_root_move(move, depth, game.get_opposite_color(game.player_color), alpha)
+    except SearchTimeout:
+        return None, False, game.nodes, None
+    finally:
+        game.stop_budget()
+        game.stop_timing()
+        game.count_shared_nodes()
+    game.stats.tt_hits = game.tt.hits - hits
+    if game.cache is not None:
+        game.stats.cache_hits = game.cache.hits - cache_hits
+
+    with shared_bounds.get_lock():
+        if shared_bounds[0] == generation and score > shared_bounds[1]:
+            shared_bounds[1] = score
+    return score, score > alpha, game.nodes, game.stats
+
+
+class GenerationCancel:
+    # Set for a worker once the shared generation has moved past the one
+    # its task was started in.
+    def __init__(self, shared_bounds, generation):
+        self.shared_bounds = shared_bounds
+        self.generation = generation
+
+
+    def is_set(self):
+        return self.shared_bounds[0] != self.generation
+
+
+def mcts_worker(snapshot, deadline, iterations, seed, generation):
+    # A tree of its own for the position; returns its root move counts.
+    game = Gomoku.from_snapshot(snapshot)
+    search = MCTS(game, seed)
+    time_limit = None if deadline is None else max(deadline - time.time(), 0)
+    cancel = GenerationCancel(_worker_state["shared_bounds"], generation)
+    root = search.search(game.get_opposite_color(game.player_color), time_limit, iterations, cancel)
+    return search.root_counts(root), search.iterations
 
 
 class Gomoku:
-    def __init__(self):
+    def __init__(self, tt_size=TT_SIZE, debug_eval=False, batch_eval=False,
+                 max_depth=SEARCH_DEPTH, time_limit=None, node_limit=None, width_limit=None, workers=1,
+                 verbose=True, timing=False, threat_solver=True, candidate_radius=CANDIDATE_RADIUS,
+                 opening_book=True, board_size=BOARD_SIZE, multi_pv=1, engine="minimax",
+                 mcts_iterations=MCTS_ITERATIONS, search_cache=None, line_cache_size=MAX_CACHED_LINES):
+        if batch_eval and not BatchEvaluator.available():
+            raise ImportError("batch_eval needs numpy")
+        if engine not in ENGINES:
+            raise ValueError(f"unknown engine {engine}")
+        self.tt = TranspositionTable(tt_size)
+        # search_cache: path of a SearchCache file shared with other engines
+        self.search_cache = search_cache
+        self.cache = SearchCache(search_cache) if search_cache is not None else None
+        self.cache_key = option_key(board_size, candidate_radius, width_limit)
+        self.board_size = board_size
+        self.line_cache_size = line_cache_size
+        self.multi_pv = multi_pv
+        self.engine = engine
+        self.mcts_iterations = mcts_iterations
+        self.debug_eval = debug_eval
+        self.batch_eval = batch_eval
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.width_limit = width_limit
+        self.workers = workers
+        self.verbose = verbose
+        self.timing = timing
+        self.threat_solver = threat_solver
+        self.candidate_radius = candidate_radius
+        self.opening_book = opening_book
+        self.book = OpeningBook() if opening_book else None
+        self.stats = SearchStats(max_depth)
+        self.stats_sinks = []
+        self.observers = []
+        self.pool = None
+        self.shared_bounds = None
+        self.shared_nodes = None
+        self.search_generation = 0
+        self.nodes = 0
+        self.root_depth = 0
+        self.deadline = None
+        self.budget_nodes = None
+        # in a root search worker, the node count of all workers
+        self.node_counter = None
+        self.counted_nodes = 0
+        self.cancel = None
+        self.next_budget_check = float('inf')
         self.initialize_game()
 
 
     def initialize_game(self):
-        self.board = [[Color.NONE] * BOARD_SIZE for _ in range(BOARD_SIZE)]
+        self.board = Bitboard(self.board_size)
+        self.evaluator = Evaluator(self.board.geometry, self.line_cache_size)
+        self.batch_evaluator = BatchEvaluator.BatchEvaluator(self.board.geometry) if self.batch_eval else None
+        self.orderer = MoveOrderer(self.board.geometry)
+        self.tt.clear()
         self.player_color = Color.BLACK
         self.game_over = False
-        self.empty_positions = {(i, j) for i in range(5, 10) for j in range(5, 10)}
+        # the empty board offers the cells around the center
+        center = self.board.index(self.board_size // 2, self.board_size // 2)
+        self.candidates = Candidates(self.board.geometry, self.candidate_radius,
+                                     [cell for cell, _ in neighborhoods(self.board.geometry, 2)[center]])
         self.last_play = None
+        self.pondered = None
+        # (x, y, color, initial) for every move played, in order
+        self.history = []
+        self.mcts = MCTS(self) if self.engine == "mcts" else None
 
 
     def set_gui(self, gui):
         self.gui = gui
+        self.add_observer(gui)
 
 
-    def is_winning_move(self, color, x, y, winning_positions = None):
-        if winning_positions is None:
-            winning_positions = []
+    def add_observer(self, observer):
+        self.observers.append(observer)
 
-        multiplyers = [(1, 0), (0, 1), (1, 1), (1, -1)]
-        for dx, dy in multiplyers:
-            if self.check_line(color, x, y, dx, dy, winning_positions):
-                return True
 
-        if self.empty_positions == set():
-            return "DRAW"
+    def remove_observer(self, observer):
+        self.observers.remove(observer)
 
-        return False
 
+    def add_stats_sink(self, sink):
+        self.stats_sinks.append(sink)
 
-    def check_line(self, color, x, y, dx, dy, winning_positions):
-        consecutive_count = 0
 
-        for i in range(-5, 6):
-            nx, ny = x + i * dx, y + i * dy
-            if 0 <= nx < BOARD_SIZE and 0 <= ny < BOARD_SIZE:
-                if self.board[nx][ny] == color:
-                    consecutive_count += 1
-                    winning_positions.append((nx, ny))
-                else:
-                    if consecutive_count == 5:
-                        return True
-                    consecutive_count = 0
-                    winning_positions.clear()
-            else:
-                if consecutive_count == 5:
-                    return True
-                consecutive_count = 0
-                winning_positions.clear()
+    def remove_stats_sink(self, sink):
+        self.stats_sinks.remove(sink)
+
+
+    def is_winning_move(self, color, x, y, winning_positions = None):
+        if winning_positions is None:
+            winning_positions = []
 
-        if consecutive_count == 5:
+        if self.board.is_five(color, x, y, winning_positions):
             return True
+
+        if not self.candidate_mask():
+            return "DRAW"
+
         return False
 
 
     def make_move(self, x, y, color, initial=False):
         if not self.is_valid(x, y) or self.game_over:
             return True
-        assert self.board[x][y] == Color.NONE
-
-        if self.last_play:
-            last_x, last_y = self.last_play
-            last_color = self.board[last_x][last_y]
-            self.draw_circle(last_x, last_y, last_color)
+        assert self.board.is_empty(x, y)
         self.last_play = (x, y)
 
-        self.board[x][y] = color
-        self.add_empty_positions(x, y)
-        if (x, y) in self.empty_positions:
-            self.empty_positions.remove((x, y))
-        self.draw_circle(x, y, color)
-        if not initial:
-            self.gui.place_dot(x, y)
+        self.place_stone(x, y, color)
+        self.history.append((x, y, color, initial))
+        for observer in self.observers:
+            observer.move_made(x, y, color, initial)
 
         winning_positions = []
         result = self.is_winning_move(color, x, y, winning_positions)
         if result:
+            self.game_over = True
             if result == "DRAW":
-                print("It's a DRAW!")
+                self.log("It's a DRAW!")
+                for observer in self.observers:
+                    observer.game_drawn()
             else:
-                self.gui.highlight_winning_cells(winning_positions)
-                print("PLAYER " + self.color_to_string(color) + " WON!!!")
-            self.game_over = True
-            self.gui.game_over()
+                self.log("PLAYER " + self.color_to_string(color) + " WON!!!")
+                for observer in self.observers:
+                    observer.game_won(color, winning_positions)
 
         return False
 
 
-    def add_empty_positions(self, x, y):
-        for i in range(x - 2, x + 2):
-            for j in range(y - 2, y + 2):
-                if i >= 0 and j >= 0 and i < BOARD_SIZE and j < BOARD_SIZE:
-                    if self.is_valid(i, j):
-                        self.empty_positions.add((i, j))
+    def take_back(self, x, y):
+        # Only the last move can be taken back.
+        if not self.history or self.history[-1][:2] != (x, y):
+            raise ValueError(f"{x},{y} is not the last move")
+        self.remove_stone(x, y)
+        self.history = [move for move in self.history if move[:2] != (x, y)]
+        self.last_play = self.history[-1][:2] if self.history else None
+        self.game_over = False
+        self.pondered = None
 
 
-    def draw_circle(self, x, y, color):
-        self.gui.place_circle(x, y, self.color_to_string(color))
+    def make_search_move(self, x, y, color):
+        # For search only: no observers and no win check.
+        self.place_stone(x, y, color)
 
 
-    def ai_make_move(self):
-        if self.game_over:
-            return
+    def unmake_search_move(self, x, y):
+        self.remove_stone(x, y)
 
-        ai_color = self.get_opposite_color(self.player_color)
 
-        best_x, best_y = self.try_basic_best_moves(ai_color)
-        if (best_x is not None and best_y is not None):
-            print()
-            print(best_x, best_y)
-            self.make_move(best_x, best_y, ai_color)
-            return
+    def place_stone(self, x, y, color):
+        self.board.place(x, y, color)
+        self.evaluator.place(x, y, color)
+        self.candidates.place(x * self.board.stride + y)
 
-        best_score = float('-inf')
-        best_move = None
 
-        for move in self.empty_positions:
-            x, y = move
-            self.board[x][y] = ai_color
-            was_in_empty = False
-            if (x, y) in self.empty_positions:
-                was_in_empty = True
-                self.empty_positions.remove((x, y))
-            score = self.minimax(2, float('-inf'), float('inf'), True)
-            self.board[x][y] = Color.NONE
-            if was_in_empty:
-                self.empty_positions.add((x, y))
+    def remove_stone(self, x, y):
+        self.board.remove(x, y)
+        self.evaluator.remove(x, y)
+        self.candidates.remove(x * self.board.stride + y)
 
-            if score > best_score:
-                best_score = score
-                best_move = move
 
-        assert best_move
-        print()
-        print(best_move[0], best_move[1])
-        self.make_move(best_move[0], best_move[1], ai_color)
+    def candidate_mask(self):
+        return self.candidates.mask(self.board.black | self.board.white)
 
 
-    def try_basic_best_moves(self, color):
-        opposite_color = self.get_opposite_color(color)
-        for x in range(BOARD_SIZE):
-            for y in range(BOARD_SIZE):
-                if (self.board[x][y] != Color.NONE):
-                    continue
+    def candidate_moves(self):
+        return list(self.board.cells(self.candidate_mask()))
 
-                if (self.simulate_and_test(x, y, color)):
-                    return x, y
-                if (self.simulate_and_test(x, y, opposite_color)):
-                    return x, y
 
+    @property
+    def empty_positions(self):
+        return set(self.board.cells(self.candidate_mask()))
 
-        for x in range(BOARD_SIZE):
-            for y in range(BOARD_SIZE):
-                if (self.board[x][y] != Color.NONE):
-                    continue
 
-                if (self.dangerous_trio(x, y, color)):
-                    return x, y
-                if (self.dangerous_trio(x, y, opposite_color)):
-                    return x, y
+    def ai_make_move(self, result=None):
+        if self.game_over:
+            return
 
-        return None, None
+        if result is None:
+            result = self.find_best_move()
+        best_move = result.move
+        self.log()
+        self.log(best_move[0], best_move[1])
+        self.make_move(best_move[0], best_move[1], self.get_opposite_color(self.player_color))
+        return result
 
 
-    def simulate_and_test(self, x, y, color):
-        self.board[x][y] = color
-        was_in_empty = False
-        if (x, y) in self.empty_positions:
-            was_in_empty = True
-            self.empty_positions.remove((x, y))
-        result = self.is_winning_move(color, x, y)
-        self.board[x][y] = Color.NONE
-        if (was_in_empty):
-            self.empty_positions.add((x, y))
+    def find_best_move(self, progress=None, cancel=None, limited=True):
+        # progress is called with the SearchResult of every finished depth.
+        # Setting the cancel event stops the search like running out of time;
+        # if not even depth 1 finished, SearchTimeout is raised. Unlimited
+        # searches ignore the time and node limits, for pondering. The
+        # result carries the SearchStats, which also go to the stats sinks.
+        start_time = time.perf_counter()
+        if limited and self.pondered is not None and self.pondered[0] == self.board.hash:
+            result = self.pondered[1]
+            self.pondered = None
+            return result._replace(nodes=0, time=time.perf_counter() - start_time)
+
+        stats = self.stats = SearchStats(self.max_depth)
+        hits = self.tt.hits
+        cache_hits = self.cache.hits if self.cache is not None else 0
+        for sink in self.stats_sinks:
+            sink.start()
+        result = None
+        self.cancel = cancel
+        if self.timing:
+            self.start_timing()
+        try:
+            result = self.search(start_time, progress, limited)
+        finally:
+            self.cancel = None
+            if self.timing:
+                self.stop_timing()
+            if result is not None:
+                stats.move, stats.score, stats.depth = result.move, result.score, result.depth
+                stats.nodes, stats.time = self.nodes, time.perf_counter() - start_time
+                stats.tt_hits += self.tt.hits - hits
+                if self.cache is not None:
+                    stats.cache_hits += self.cache.hits - cache_hits
+                stats.pv = self.principal_variation(result)
+            for sink in self.stats_sinks:
+                sink.finish(stats if result is not None else None)
+        return result._replace(nodes=stats.nodes, time=stats.time, stats=stats)
+
+
+    def search(self, start_time, progress=None, limited=True):
+        ai_color = self.get_opposite_color(self.player_color)
+        self.tt.new_search()
+        if self.cache is not None:
+            self.cache.new_search()
+        self.orderer.new_search()
+        self.nodes = 0
+        # Every empty cell next to a stone is a candidate, so no candidates
+        # means a full board.
+        if not self.candidate_mask():
+            raise ValueError("the board is full")
+
+        best_x, best_y = None, None
+        if self.book is not None:
+            best_x, best_y = self.book.move(self.board) or (None, None)
+        if best_x is None and self.threat_solver:
+            best_x, best_y = self.solve_threats(ai_color) or (None, None)
+        if best_x is None:
+            best_x, best_y = self.try_basic_best_moves(ai_color)
+        if (best_x is not None and best_y is not None):
+            return SearchResult((best_x, best_y), None, 0, 0, time.perf_counter() - start_time)
+        if self.engine == "mcts":
+            return self.search_mcts(start_time, progress, limited)
+
+        # Iterative deepening: every completed depth reorders the root moves
+        # for the next one, and running out of time or nodes falls back to the
+        # best move of the last depth that finished. Depth 1 always finishes.
+        moves = self.order_moves(ai_color, 0)
+        result = None
+        for depth in range(1, self.max_depth + 1):
+            self.start_budget(start_time, depth, limited)
+            self.stats.ply_nodes[0] += 1
+            try:
+                # the shared bound of the workers only keeps the best score
+                if self.workers > 1 and self.multi_pv == 1:
+                    scores = self.search_root_parallel(moves, depth, ai_color)
+                else:
+                    scores = self.search_root(moves, depth, ai_color)
+            except SearchTimeout:
+                break
+            finally:
+                self.stop_budget()
+
+            # (score, exact) pairs: an exact score wins a tie with a bound
+            ordered = sorted(zip(moves, scores), key=lambda move_score: move_score[1], reverse=True)
+            moves = [move for move, _ in ordered]
+            alternatives = None
+            if self.multi_pv > 1:
+                alternatives = [(move, score) for move, (score, exact) in ordered[:self.multi_pv] if exact]
+            result = SearchResult(moves[0], ordered[0][1][0], depth, self.nodes, time.perf_counter() - start_time,
+                                  alternatives=alternatives)
+            if progress is not None:
+                progress(result)
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                break
+            if self.budget_nodes is not None and self.nodes >= self.budget_nodes:
+                break
+
+        if result is None:
+            raise SearchTimeout()
         return result
 
 
-    def dangerous_trio(self, x, y, color):
-        multiplyers = [(1, 0), (0, 1), (1, 1), (1, -1)]
-        for dx, dy in multiplyers:
-            for i in range(1, 5):
-                new_x = x + i * dx
-                new_y = y + i * dy
-                if not self.in_range(new_x, new_y):
-                    break
-                if i != 4 and self.board[new_x][new_y] != self.get_opposite_color(color):
+    def search_mcts(self, start_time, progress=None, limited=True):
+        # Anytime: runs for the time limit, else node_limit or mcts_iterations
+        # iterations, or until cancelled. With workers > 1 the other
+        # processes grow trees of their own for the same position and their
+        # root move counts are added to this one's.
+        ai_color = self.get_opposite_color(self.player_color)
+        time_limit = self.time_limit if limited else None
+        iterations = self.node_limit if limited else None
+        if iterations is None and time_limit is None:
+            iterations = self.mcts_iterations
+
+        futures = []
+        if self.workers > 1:
+            pool = self.search_pool()
+            self.search_generation += 1
+            with self.shared_bounds.get_lock():
+                self.shared_bounds[0] = self.search_generation
+            deadline = None if time_limit is None else time.time() + time_limit
+            snapshot = self.snapshot()
+            futures = [pool.submit(mcts_worker, snapshot, deadline, iterations, seed, self.search_generation)
+                       for seed in range(1, self.workers)]
+
+        def report(root, depth, done):
+            if progress is not None and root.children:
+                child, rate = self.mcts.best_child(root)
+                progress(SearchResult(child.move, rate, depth, done, time.perf_counter() - start_time))
+
+        root = self.mcts.search(ai_color, time_limit, iterations, self.cancel, report)
+        self.nodes = self.mcts.iterations
+        counts = self.mcts.root_counts(root)
+        if futures and self.cancel is not None and self.cancel.is_set():
+            # stops the workers, which still report what they have
+            self.search_generation += 1
+            with self.shared_bounds.get_lock():
+                self.shared_bounds[0] = self.search_generation
+        for future in futures:
+            worker_counts, worker_iterations = future.result()
+            self.nodes += worker_iterations
+            for move, (visits, wins) in worker_counts.items():
+                own_visits, own_wins = counts.get(move, (0, 0.0))
+                counts[move] = (own_visits + visits, own_wins + wins)
+
+        if not counts:
+            raise SearchTimeout()
+        won = [child.move for child in root.children if child.winner == child.color]
+        move = won[0] if won else max(counts, key=lambda move: counts[move][0])
+        visits, wins = counts[move]
+        return SearchResult(move, wins / visits, self.mcts.max_depth, self.nodes, time.perf_counter() - start_time)
+
+
+    def principal_variation(self, result):
+        # The root move, then the best moves stored for the positions after
+        # it. Like the search, the AI replies to its own root move.
+        pv = [result.move]
+        ai_color = self.get_opposite_color(self.player_color)
+        self.make_search_move(result.move[0], result.move[1], ai_color)
+        played = [result.move]
+        maximizing_player = True
+        try:
+            for _ in range(result.depth - 1):
+                move = self.stored_move(self.search_key(maximizing_player))
+                if move is None or not self.is_valid(move[0], move[1]):
                     break
-                if i == 4 and self.board[new_x][new_y] == Color.NONE:
-                    return True
+                color = ai_color if maximizing_player else self.player_color
+                self.make_search_move(move[0], move[1], color)
+                played.append(move)
+                pv.append(move)
+                maximizing_player = not maximizing_player
+        finally:
+            for x, y in reversed(played):
+                self.unmake_search_move(x, y)
+        return pv
+
+
+    def search_key(self, maximizing_player):
+        # Transposition table key of the current position, as in minimax.
+        key = self.board.hash
+        if maximizing_player:
+            key ^= MAXIMIZING_KEY
+        if self.player_color == Color.BLACK:
+            key ^= WHITE_AI_KEY
+        return key
+
+
+    def stored_move(self, key):
+        # The best move stored for the key, by this search or another one.
+        move = self.tt.best_move(key)
+        if move is None and self.cache is not None:
+            move = self.cache.best_move(key ^ self.cache_key)
+        return move
+
+
+    def start_timing(self):
+        # Instance attributes shadow the methods while the search runs.
+        stats = self.stats
+        self.order_moves = stats.timed("move_generation", Gomoku.order_moves.__get__(self))
+        self.evaluate_position = stats.timed("evaluation", Gomoku.evaluate_position.__get__(self))
+        self.try_basic_best_moves = stats.timed("win_checks", Gomoku.try_basic_best_moves.__get__(self))
+        self.solve_threats = stats.timed("win_checks", Gomoku.solve_threats.__get__(self))
+        self.is_winning_move = stats.timed("win_checks", Gomoku.is_winning_move.__get__(self))
+        if self.batch_evaluator is not None:
+            self.batch_evaluator.evaluate_moves = stats.timed("evaluation", BatchEvaluator.BatchEvaluator.evaluate_moves.__get__(self.batch_evaluator))
+
+
+    def stop_timing(self):
+        for name in ("order_moves", "evaluate_position", "try_basic_best_moves", "solve_threats", "is_winning_move"):
+            self.__dict__.pop(name, None)
+        if self.batch_evaluator is not None:
+            self.batch_evaluator.__dict__.pop("evaluate_moves", None)
+
+
+    def ponder(self, progress=None, cancel=None):
+        # Searches the position after the most likely reply of the player
+        # while they think. If they play it, find_best_move returns the
+        # pondered result at once; otherwise the search still left its
+        # positions in the transposition table.
+        reply = self.predict_reply()
+        if reply is None:
+            return None
+        x, y = reply
+        self.place_stone(x, y, self.player_color)
+        try:
+            if self.board.is_five(self.player_color, x, y) or not self.candidate_mask():
+                return None
+            result = self.find_best_move(progress, cancel, limited=False)
+            if result.depth in (0, self.max_depth):
+                self.pondered = (self.board.hash, result)
+            return result
+        except SearchTimeout:
+            return None
+        finally:
+            self.remove_stone(x, y)
+
+
+    def predict_reply(self):
+        # The player's most threatening candidate: a guess by move ordering.
+        # The search does not leave the player's reply in the table, as the
+        # AI also plays the first move after its root move.
+        moves = self.order_moves(self.player_color, 0)
+        return moves[0] if moves else None
+
+
+    def search_root(self, moves, depth, ai_color):
+        # Returns (score, exact) for every move. Moves searched against the
+        # multi_pv best scores found earlier only get an upper bound.
+        scores = []
+        best_scores = []
+        for move in moves:
+            alpha = best_scores[-1] if len(best_scores) >= self.multi_pv else float('-inf')
+            score = self.search_root_move(move, depth, ai_color, alpha)
+            scores.append((score, score > alpha))
+            if score > alpha:
+                best_scores.append(score)
+                best_scores.sort(reverse=True)
+                del best_scores[self.multi_pv:]
+        return scores
+
+
+    def search_root_move(self, move, depth, ai_color, alpha):
+        self.root_depth = depth
+        x, y = move
+        self.make_search_move(x, y, ai_color)
+        try:
+            return self.minimax(depth - 1, alpha, float('inf'), True)
+        finally:
+            self.unmake_search_move(x, y)
+
+
+    def search_root_parallel(self, moves, depth, ai_color):
+        # One task per root move, so faster workers pick up more of them. The
+        # best score so far is shared between workers as their alpha.
+        pool = self.search_pool()
+        self.search_generation += 1
+        with self.shared_bounds.get_lock():
+            self.shared_bounds[0] = self.search_generation
+            self.shared_bounds[1] = float('-inf')
+
+        deadline = None
+        if depth > 1 and self.deadline is not None:
+            deadline = time.time() + self.deadline - time.perf_counter()
+        # The workers add their nodes to the shared count, which starts at
+        # the nodes searched so far, and stop at the same node limit.
+        with self.shared_nodes.get_lock():
+            self.shared_nodes.value = self.nodes
+        snapshot = self.snapshot()
+        futures = [pool.submit(search_root_move_worker, snapshot, move, depth, self.search_generation, deadline,
+                               self.budget_nodes)
+                   for move in moves]
+
+        scores = []
+        try:
+            for future in futures:
+                while self.cancel is not None and not future.done():
+                    if self.cancel.wait(CANCEL_POLL_INTERVAL):
+                        raise SearchTimeout()
+                score, exact, nodes, stats = future.result()
+                self.nodes += nodes
+                if score is None:
+                    raise SearchTimeout()
+                self.stats.merge(stats)
+                scores.append((score, exact))
+        except SearchTimeout:
+            for future in futures:
+                future.cancel()
+            raise
+        return scores
+
+
+    def search_pool(self):
+        if self.pool is None:
+            # Imported here: most games never start a pool, and engine
+            # protocol mode has to start quickly.
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # spawn rather than fork, the GUI process has Tk running
+            context = multiprocessing.get_context("spawn")
+            self.shared_bounds = context.Array('d', [0.0, float('-inf')])
+            self.shared_nodes = context.Value('q', 0)
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=context, initializer=init_search_worker,
+                                            initargs=(self.shared_bounds, self.shared_nodes))
+        return self.pool
+
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+
+    def snapshot(self):
+        stones = [(x, y, Color.BLACK.value) for x, y in self.board.cells(self.board.black)]
+        stones += [(x, y, Color.WHITE.value) for x, y in self.board.cells(self.board.white)]
+        return {
+            "hash": self.board.hash,
+            "stones": stones,
+            "player_color": self.player_color.value,
+            "options": {
+                "tt_size": self.tt.size,
+                "debug_eval": self.debug_eval,
+                "batch_eval": self.batch_eval,
+                "max_depth": self.max_depth,
+                "width_limit": self.width_limit,
+                "timing": self.timing,
+                "threat_solver": self.threat_solver,
+                "candidate_radius": self.candidate_radius,
+                "opening_book": self.opening_book,
+                "board_size": self.board_size,
+                "multi_pv": self.multi_pv,
+                "engine": self.engine,
+                "mcts_iterations": self.mcts_iterations,
+                "search_cache": self.search_cache,
+                "line_cache_size": self.line_cache_size,
+            },
+        }
+
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        game = cls(**snapshot["options"])
+        for x, y, color in snapshot["stones"]:
+            game.place_stone(x, y, Color(color))
+        game.player_color = Color(snapshot["player_color"])
+        return game
+
+
+    def start_budget(self, start_time, depth, limited=True):
+        # Depth 1 always finishes, unless the search is cancelled.
+        self.deadline = None
+        self.budget_nodes = None
+        if depth > 1 and limited:
+            if self.time_limit is not None:
+                self.deadline = start_time + self.time_limit
+            self.budget_nodes = self.node_limit
+        if self.deadline is not None or self.budget_nodes is not None or self.cancel is not None:
+            self.next_budget_check = self.nodes + 1
+
+
+    def stop_budget(self):
+        self.next_budget_check = float('inf')
+
+
+    def count_shared_nodes(self):
+        # Adds the nodes since the last call to the shared count and returns
+        # the total; without one, just the nodes of this search.
+        if self.node_counter is None:
+            return self.nodes
+        with self.node_counter.get_lock():
+            self.node_counter.value += self.nodes - self.counted_nodes
+            self.counted_nodes = self.nodes
+            return self.node_counter.value
+
+
+    def check_budget(self):
+        if self.cancel is not None and self.cancel.is_set():
+            raise SearchTimeout()
+        nodes = self.nodes
+        if self.budget_nodes is not None:
+            nodes = self.count_shared_nodes()
+            if nodes >= self.budget_nodes:
+                raise SearchTimeout()
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+        self.next_budget_check = self.nodes + BUDGET_CHECK_INTERVAL
+        if self.budget_nodes is not None:
+            self.next_budget_check = min(self.next_budget_check, self.nodes + self.budget_nodes - nodes)
 
-            for i in range(-2, 4):
-                new_x = x + i * dx
-                new_y = y + i * dy
-                if not self.in_range(new_x, new_y):
-                    break
-                if i == -2 and self.board[new_x][new_y] != Color.NONE:
-                    break
-                if (i == -1 or i == 1 or i == 2) and self.board[new_x][new_y] != self.get_opposite_color(color):
-                    break
-                if i == 3 and self.board[new_x][new_y] == Color.NONE:
-                    return True
 
-            for i in range(-3, 3):
-                new_x = x + i * dx
-                new_y = y + i * dy
-                if not self.in_range(new_x, new_y):
-                    break
-                if i == -3 and self.board[new_x][new_y] != Color.NONE:
-                    break
-                if (i == -2 or i == -1 or i == 1) and self.board[new_x][new_y] != self.get_opposite_color(color):
-                    break
-                if i == 2 and self.board[new_x][new_y] == Color.NONE:
-                    return True
+    def try_basic_best_moves(self, color):
+        opposite_color = self.get_opposite_color(color)
+        # Both scans return the first hit in row-major order, which is the
+        # lowest set bit of the combined masks.
+        winning = self.board.five_points(color) | self.board.five_points(opposite_color)
+        candidates = self.candidate_mask()
+        if candidates and not candidates & (candidates - 1):
+            # simulate_and_test reports a DRAW as soon as the last candidate is taken
+            winning |= candidates
+        if winning:
+            return self.board.first_cell(winning)
+
+        trios = self.board.trio_points(opposite_color) | self.board.trio_points(color)
+        return self.board.first_cell(trios)
+
+
+    def solve_threats(self, color):
+        # Forced moves: completing five, blocking one, a win by fours, a
+        # defence against the opponent's, then a win by threes. None leaves
+        # the position to try_basic_best_moves and the search.
+        solver = ThreatSolver(self.board)
+        opponent = self.get_opposite_color(color)
+        for points in (solver.five_points(color), solver.five_points(opponent)):
+            if points:
+                return self.board.cell(min(points))
+
+        move = solver.solve(color)
+        if move is not None:
+            return move
+        if solver.solve(opponent) is not None:
+            return solver.defend(color)
+        return solver.solve(color, vct=True)
 
-        return False
+
+    def simulate_and_test(self, x, y, color):
+        self.make_search_move(x, y, color)
+        result = self.is_winning_move(color, x, y)
+        self.unmake_search_move(x, y)
+        return result
+
+
+    def dangerous_trio(self, x, y, color):
+        return self.board.is_trio_point(self.get_opposite_color(color), x, y)
 
 
     def in_range(self, x, y):
-        return (x >= 0 and y >= 0 and x < BOARD_SIZE and y < BOARD_SIZE)
+        return (x >= 0 and y >= 0 and x < self.board_size and y < self.board_size)
 
 
     def minimax(self, depth, alpha, beta, maximizing_player):
         ai_color = self.get_opposite_color(self.player_color)
+        self.nodes += 1
+        if self.nodes >= self.next_budget_check:
+            self.check_budget()
+        ply = self.root_depth - depth
+        stats = self.stats
+        stats.ply_nodes[ply] += 1
+
+        key = self.board.hash
+        if maximizing_player:
+            key ^= MAXIMIZING_KEY
+        if ai_color == Color.WHITE:
+            key ^= WHITE_AI_KEY
+
+        alpha_orig, beta_orig = alpha, beta
+        tt_move = None
+        entry = self.tt.probe(key)
+        if self.cache is not None and depth >= CACHE_MIN_DEPTH and (entry is None or entry[1] < depth):
+            # an earlier iteration left a shallower entry; the cache may hold a deeper one
+            cached = self.cache.probe(key ^ self.cache_key)
+            if cached is not None and (entry is None or cached[1] > entry[1]):
+                entry = cached
+        if entry is not None:
+            _, entry_depth, flag, score, tt_move, _ = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return score
+                if flag == LOWER:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if beta <= alpha:
+                    return score
 
         if depth == 0 or self.game_over:
-            return self.evaluate_position(ai_color)
+            stats.leaves += 1
+            score = self.evaluate_position(ai_color)
+            self.tt.store(key, depth, EXACT, score, None)
+            return score
+
+        # Threat ranking pays off above the frontier; the children of a
+        # depth-1 node are leaves and only get the cheap killer/history order.
+        moves = self.order_moves(ai_color if maximizing_player else self.player_color, ply, tt_move,
+                                 threats=depth >= 2 or self.width_limit is not None)
+
+        if depth == 1 and moves and self.batch_evaluator is not None:
+            # All children are leaves: score them in one go, without cutoffs.
+            color = ai_color if maximizing_player else self.player_color
+            scores = self.batch_evaluator.evaluate_moves(self.board, moves, color, ai_color)
+            stats.leaves += len(moves)
+            score = max(scores) if maximizing_player else min(scores)
+            if self.debug_eval:
+                for move, batch_score in zip(moves, scores):
+                    self.place_stone(move[0], move[1], color)
+                    assert batch_score == self.evaluate_position(ai_color), (move, batch_score)
+                    self.remove_stone(move[0], move[1])
+            self.store_entry(key, depth, EXACT, score, moves[scores.index(score)])
+            return score
 
+        best_move = None
         if maximizing_player:
             max_eval = float('-inf')
-            for move in list(self.empty_positions):
+            for move in moves:
                 i, j = move
-                self.board[i][j] = ai_color
-                was_in_empty = False
-                if (i, j) in self.empty_positions:
-                    was_in_empty = True
-                    self.empty_positions.remove((i, j))
-                eval = self.minimax(depth - 1, alpha, beta, False)
-                self.board[i][j] = Color.NONE
-                if was_in_empty:
-                    self.empty_positions.add((i, j))
-                max_eval = max(max_eval, eval)
+                self.make_search_move(i, j, ai_color)
+                try:
+                    eval = self.minimax(depth - 1, alpha, beta, False)
+                finally:
+                    self.unmake_search_move(i, j)
+                if eval > max_eval:
+                    max_eval = eval
+                    best_move = move
                 alpha = max(alpha, eval)
                 if beta <= alpha:
+                    stats.ply_cutoffs[ply] += 1
+                    self.orderer.record_cutoff(move, ai_color, ply, depth)
                     break
+            self.store_result(key, depth, alpha_orig, beta_orig, max_eval, best_move)
             return max_eval
         else:
             min_eval = float('inf')
-            for move in list(self.empty_positions):
+            for move in moves:
                 i, j = move
-                self.board[i][j] = self.player_color
-                was_in_empty = False
-                if (i, j) in self.empty_positions:
-                    was_in_empty = True
-                    self.empty_positions.remove((i, j))
-                eval = self.minimax(depth - 1, alpha, beta, True)
-                self.board[i][j] = Color.NONE
-                if was_in_empty:
-                    self.empty_positions.add((i, j))
-                min_eval = min(min_eval, eval)
+                self.make_search_move(i, j, self.player_color)
+                try:
+                    eval = self.minimax(depth - 1, alpha, beta, True)
+                finally:
+                    self.unmake_search_move(i, j)
+                if eval < min_eval:
+                    min_eval = eval
+                    best_move = move
                 beta = min(beta, eval)
                 if beta <= alpha:
+                    stats.ply_cutoffs[ply] += 1
+                    self.orderer.record_cutoff(move, self.player_color, ply, depth)
                     break
+            self.store_result(key, depth, alpha_orig, beta_orig, min_eval, best_move)
             return min_eval
 
 
-    def evaluate_position(self, color, calc_proxi = True):
-        score = 0
-        for x in range(BOARD_SIZE):
-            for y in range(BOARD_SIZE):
-                if self.board[x][y] == color:
-                    score += self.count_connected(color, x, y)
-                    score += self.trio_bonus(color, x, y)
-                    if calc_proxi:
-                        score += self.edge_proximity_bonus(x, y)
-        return score
+    def order_moves(self, color, ply, tt_move=None, threats=True):
+        moves = self.orderer.order(self.board, self.candidate_moves(), color, ply, tt_move, threats)
+        if self.width_limit is not None:
+            del moves[self.width_limit:]
+        return moves
 
 
-    def count_connected(self, color, x, y):
-        connected = 0
-        for dx, dy in [(0, 1), (1, 0), (1, 1), (-1, 1)]:
-            nx, ny = x + dx, y + dy
-            if 0 <= nx < BOARD_SIZE and 0 <= ny < BOARD_SIZE and self.board[nx][ny] == color:
-                connected += 1
-        return connected
-
-
-    def trio_bonus(self, color, x, y):
-        trio_counter = 0
-        for dx, dy in [(0, 1), (1, 0), (1, 1), (-1, 1)]:
-            stone_count = 1
-            empty_count = 0
-            for i in range(1, 4):
-                nx, ny = x + i * dx, y + i * dy
-                if 0 <= nx < BOARD_SIZE and 0 <= ny < BOARD_SIZE:
-                    if self.board[nx][ny] == color:
-                        stone_count += 1
-                    elif self.board[nx][ny] == Color.NONE:
-                        empty_count += 1
-                    else:
-                        break
-                else:
-                    break
+    def store_result(self, key, depth, alpha, beta, score, best_move):
+        if score <= alpha:
+            flag = UPPER
+        elif score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.store_entry(key, depth, flag, score, best_move)
 
-            if stone_count == 3 and empty_count > 0:
-                trio_counter += 1
 
-        return trio_counter
+    def store_entry(self, key, depth, flag, score, move):
+        # Leaves stay out of the search cache, see CACHE_MIN_DEPTH.
+        self.tt.store(key, depth, flag, score, move)
+        if self.cache is not None and depth >= CACHE_MIN_DEPTH:
+            self.cache.store(key ^ self.cache_key, depth, flag, score, move)
+
+
+    def evaluate_position(self, color, calc_proxi = True):
+        score = self.evaluator.score(color, calc_proxi)
+        if self.debug_eval:
+            full_score = self.evaluate_position_full(color, calc_proxi)
+            assert score == full_score, (score, full_score)
+        return score
+
+
+    def evaluate_position_full(self, color, calc_proxi = True):
+        score = self.board.pair_count(color) + self.board.trio_count(color)
+        if calc_proxi:
+            score += self.board.proximity_sum(color)
+        return score
 
 
     def edge_proximity_bonus(self, x, y):
-        distance_from_center = abs(x - BOARD_SIZE // 2) + abs(y - BOARD_SIZE // 2)
-        return 2 ** (BOARD_SIZE // 2 - distance_from_center)
+        return self.board.proximity[self.board.index(x, y)]
 
 
     def get_opposite_color(self, color):
@@ -329,6 +920,20 @@ class Gomoku:
             return Color.BLACK
 
 
+    def choose_starting_color(self):
+        # The color the AI takes after the Swap2 stones, from the opening
+        # book when it has the position.
+        if self.book is not None:
+            color = self.book.color_choice(self.board)
+            if color is not None:
+                return color
+        black_value = self.evaluate_starting(Color.BLACK)
+        white_value = self.evaluate_starting(Color.WHITE)
+        if black_value >= white_value:
+            return Color.BLACK
+        return Color.WHITE
+
+
     #TODO: musel jsem oddelat pocitani proxi, ale mozna by to tam nejak chtelo
     def evaluate_starting(self, color):
         if color == Color.BLACK:
@@ -337,11 +942,16 @@ class Gomoku:
         best = 0
         best_move = (-1, -1)
 
-        for move in list(self.empty_positions):
+        if self.batch_evaluator is not None:
+            moves = self.candidate_moves()
+            scores = self.batch_evaluator.evaluate_moves(self.board, moves, color, color, calc_proxi=False)
+            return max([best] + scores)
+
+        for move in self.candidate_moves():
             i, j = move
-            self.board[i][j] = color
+            self.place_stone(i, j, color)
             eval = self.evaluate_position(color, calc_proxi=False)
-            self.board[i][j] = Color.NONE
+            self.remove_stone(i, j)
             if (eval > best):
                 best = eval
                 best_move = (i, j)
@@ -350,7 +960,7 @@ class Gomoku:
 
 
     def is_valid(self, x, y):
-        return self.board[x][y] == Color.NONE
+        return self.board.is_empty(x, y)
 
 
     def color_to_string(self, color):
@@ -359,16 +969,39 @@ class Gomoku:
         return "WHITE"
 
 
-def play_game(game):
+    def log(self, *args):
+        if self.verbose:
+            print(*args)
+
+
+def play_game(game, archive_path=None):
+    # tkinter is only needed here, the engine runs without a display.
+    # Finished games are appended to archive_path, if given.
+    import tkinter as tk
+    from GomokuGUI import GomokuGUI
+    from GameRecord import GameArchive
+
     root = tk.Tk()
     root.resizable(width=False, height=False)
 
     gui = GomokuGUI(root, game)
     game.set_gui(gui)
+    if archive_path is not None:
+        game.add_observer(GameArchive(game, archive_path))
     gui.init_gui()
 
     root.mainloop()
 
 
 if __name__ == "__main__":
-    play_game(Gomoku())
\ No newline at end of file
+    import argparse
+    from GameRecord import ARCHIVE_PATH
+
+    parser = argparse.ArgumentParser(description="Play Gomoku against the AI.")
+    parser.add_argument("--size", type=int, default=BOARD_SIZE, help="board size, 15 by default")
+    parser.add_argument("--search-cache", default=None, help="search cache file kept across games and processes")
+    parser.add_argument("--archive", default=ARCHIVE_PATH, help="record file finished games are appended to")
+    parser.add_argument("--no-archive", dest="archive", action="store_const", const=None,
+                        help="do not record games")
+    args = parser.parse_args()
+    play_game(Gomoku(board_size=args.size, search_cache=args.search_cache), args.archive)
\ No newline at end of file
@@ -1,34 +1,34 @@
 import tkinter as tk
 from tkinter import ttk
-from enum import Enum
 import time
 import random
+from BackgroundSearch import BackgroundSearch
+from BoardRenderer import BoardRenderer, CELL, BACKGROUND
+from Color import Color
+from GameObserver import GameObserver
+from Openings import OPENINGS, centered
 
-BOARD_SIZE = 15
 SWAP2 = True
+# Search the expected reply while the player thinks.
+PONDER = True
 
 
-class Color(Enum):
-    NONE = 0
-    BLACK = 1
-    WHITE = 2
-
-
-class GomokuGUI:
-    def __init__(self, master, game, size=15):
+class GomokuGUI(GameObserver):
+    def __init__(self, master, game):
         self.game = game
         self.master = master
         self.master.title("Gomoku")
 
-        self.canvas = tk.Canvas(self.master, width=size*30, height=size*30, bg="#BF8962")
+        size = game.board.size
+        self.canvas = tk.Canvas(self.master, width=size*CELL, height=size*CELL, bg=BACKGROUND)
         if not SWAP2:
             self.canvas.bind("<Button-1>", self.on_canvas_click)
         self.canvas.pack()
 
         self.size = size
-        self.circle_radius = 12
-
-        self.draw_board()
+        self.search = None
+        self.ponder_search = None
+        self.renderer = BoardRenderer(self.master, self.canvas, size)
 
         self.text_visible = False
         self.reset_button = ttk.Button(self.master, text="Reset Game", command=lambda: self.reset_game())
@@ -38,9 +38,8 @@ class GomokuGUI:
 
 
     def init_gui(self):
-        self.canvas.delete("all")
+        self.renderer.clear()
         self.reset_button.pack_forget()
-        self.draw_board()
 
         self.reset_button.pack()
 
@@ -78,9 +77,9 @@ class GomokuGUI:
 
     def on_initial_stone_click(self, event):
         x, y = event.x, event.y
-        board_x = x // 30
-        board_y = y // 30
-        if ((board_x) >= BOARD_SIZE or (board_y) >= BOARD_SIZE) or self.initial_stones_placed >= 2:
+        board_x = x // CELL
+        board_y = y // CELL
+        if ((board_x) >= self.size or (board_y) >= self.size) or self.initial_stones_placed >= 2:
             return
         if not self.game.is_valid(board_x, board_y):
             return
@@ -94,19 +93,13 @@ class GomokuGUI:
         if self.initial_stones_placed == 2:
             self.canvas.unbind("<Button-1>")
 
-            best_color = None
-            black_value = self.game.evaluate_starting(Color.BLACK)
-            white_value = self.game.evaluate_starting(Color.WHITE)
-            if black_value >= white_value:
-                best_color = Color.BLACK
-            else:
-                best_color = Color.WHITE
+            best_color = self.game.choose_starting_color()
 
             self.game.player_color = self.game.get_opposite_color(best_color)
             self.current_stone_label.config(text=f"You are playing as {self.game.color_to_string(self.game.player_color)}")
 
             if best_color == Color.WHITE:
-                self.game.ai_make_move()
+                self.start_ai_move()
 
             self.canvas.bind("<Button-1>", self.on_canvas_click)
 
@@ -116,7 +109,7 @@ class GomokuGUI:
 
         self.game.player_color = color
         if color == Color.BLACK:
-             self.game.ai_make_move()
+             self.start_ai_move()
 
         self.black_button.pack_forget()
         self.white_button.pack_forget()
@@ -125,88 +118,116 @@ class GomokuGUI:
 
 
     def place_initial_moves(self):
-        openings = [
-            [(7, 7, Color.BLACK), (7, 8, Color.BLACK), (8, 7, Color.WHITE)],
-            [(7, 7, Color.BLACK), (8, 8, Color.BLACK), (6, 6, Color.WHITE)],
-            [(7, 7, Color.BLACK), (7, 8, Color.BLACK), (7, 6, Color.WHITE)],
-            [(7, 7, Color.BLACK), (8, 7, Color.BLACK), (6, 7, Color.WHITE)],
-            [(7, 7, Color.BLACK), (8, 7, Color.BLACK), (7, 8, Color.WHITE)],
-            [(5, 6, Color.BLACK), (8, 9, Color.BLACK), (7, 7, Color.WHITE)],
-            [(6, 6, Color.BLACK), (8, 7, Color.BLACK), (8, 6, Color.WHITE)],
-            [(6, 7, Color.BLACK), (9, 7, Color.BLACK), (7, 7, Color.WHITE)]
-        ]
-        chosen_opening = random.choice(openings)
+        chosen_opening = centered(random.choice(OPENINGS), self.size)
         for x, y, color in chosen_opening:
             self.game.make_move(x, y, color, initial=True)
 
 
-    def game_over(self):
-        self.canvas.unbind("<Button-1>")
+    def move_made(self, x, y, color, initial):
+        # Only the newest stone carries the red dot.
+        self.renderer.place_stone(x, y, self.game.color_to_string(color))
+        if initial:
+            self.renderer.mark_last(None, None)
+        else:
+            self.renderer.mark_last(x, y)
 
 
-    def draw_board(self):
-        for i in range(self.size):
-            for j in range(self.size):
-                x1, y1 = i * 30, j * 30
-                x2, y2 = x1 + 30, y1 + 30
-                self.canvas.create_rectangle(x1, y1, x2, y2, outline="black", tags=(i, j))
+    def game_won(self, color, winning_cells):
+        self.highlight_winning_cells(winning_cells)
+        self.game_over()
+
+
+    def game_drawn(self):
+        self.game_over()
+
+
+    def game_over(self):
+        self.canvas.unbind("<Button-1>")
 
 
     def on_canvas_click(self, event):
+        if self.search is not None:
+            return
         if self.text_visible:
             self.current_stone_label.pack_forget()
 
         x, y = event.x, event.y
         start_time = time.time()
-        board_x = x // 30
-        board_y = y // 30
-        if ((board_x) >= BOARD_SIZE or (board_y) >= BOARD_SIZE):
+        board_x = x // CELL
+        board_y = y // CELL
+        if ((board_x) >= self.size or (board_y) >= self.size):
             return
+        self.stop_pondering()
         ended = self.game.make_move(board_x, board_y, self.game.player_color)
         if not ended:
-            self.master.after(1, lambda: self.finish_ai_move(start_time))
+            self.start_ai_move(start_time)
+
+
+    def start_ai_move(self, start_time=None):
+        # The game belongs to the search thread until finish_ai_move.
+        self.stop_pondering()
+        if start_time is None:
+            start_time = time.time()
+        self.master.title("Gomoku - thinking")
+        self.search = BackgroundSearch(self.master,
+                                       lambda progress, cancel: self.game.find_best_move(progress, cancel),
+                                       self.show_progress,
+                                       lambda result, error: self.finish_ai_move(start_time, result, error))
+
+
+    def show_progress(self, result):
+        self.master.title(f"Gomoku - thinking, depth {result.depth}")
 
 
-    def finish_ai_move(self, start_time):
-        self.game.ai_make_move()
+    def finish_ai_move(self, start_time, result, error):
+        self.search = None
+        self.master.title("Gomoku")
+        if error is not None:
+            raise error
+        self.game.ai_make_move(result)
         end_time = time.time()
         duration_ms = round((end_time - start_time) * 1000, 2)
         print("AI move time:", duration_ms, "ms")
+        self.start_pondering()
 
 
-    def place_circle(self, i, j, color, outline_color="black", outline_width=1):
-        x, y = i * 30 + 15, j * 30 + 15
-        circle_id = self.canvas.create_oval(x - self.circle_radius, y - self.circle_radius,
-                                            x + self.circle_radius, y + self.circle_radius,
-                                            outline=outline_color, fill=color, width=outline_width)
-        return circle_id
+    def start_pondering(self):
+        if not PONDER or self.game.game_over:
+            return
+        self.ponder_search = BackgroundSearch(self.master,
+                                              lambda progress, cancel: self.game.ponder(None, cancel),
+                                              on_done=self.finish_pondering)
 
 
-    def place_dot(self, x, y):
-        center_x = x * 30 + 15
-        center_y = y * 30 + 15
-        dot_radius = 3
+    def finish_pondering(self, result, error):
+        self.ponder_search = None
+        if error is not None:
+            raise error
 
-        self.canvas.create_oval(
-            center_x - dot_radius, center_y - dot_radius,
-            center_x + dot_radius, center_y + dot_radius,
-            fill="red", outline="red", width=2
-        )
 
+    def stop_pondering(self):
+        if self.ponder_search is not None:
+            self.ponder_search.cancel()
+            self.ponder_search = None
 
-    def highlight_winning_cells(self, winning_cells):
-        for i, j in winning_cells:
-            self.place_circle(i, j, "white" if self.game.board[i][j] == Color.WHITE else "black", "red", 3)
 
+    def stop_searches(self):
+        self.stop_pondering()
+        if self.search is not None:
+            self.search.cancel()
+            self.search = None
+            self.master.title("Gomoku")
 
-    def reset_board(self):
-        self.canvas.delete("all")
-        self.draw_board()
+
+    def highlight_winning_cells(self, winning_cells):
+        colors = [self.game.color_to_string(self.game.board.get(i, j)) for i, j in winning_cells]
+        self.renderer.highlight(winning_cells, colors)
 
 
     def reset_game(self):
+        self.stop_searches()
         self.game.initialize_game()
-        self.canvas.delete("all")
+        self.renderer.clear()
 
         self.reset_button.pack_forget()
 
@@ -216,7 +237,6 @@ class GomokuGUI:
             self.place_stones_button.pack_forget()
             self.current_stone_label.pack_forget()
 
-        self.draw_board()
         if SWAP2:
             self.canvas.unbind("<Button-1>")
         else:
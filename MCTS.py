@@ -0,0 +1,283 @@
+import math
+import random
+import time
+from Color import Color
+from ThreatSolver import ThreatSolver
+
+# UCT exploration constant.
+EXPLORATION = 1.4
+# Iterations per search when there is neither a time nor a node limit.
+MCTS_ITERATIONS = 2000
+# Rollouts played from every new leaf, one after the other.
+ROLLOUTS_PER_LEAF = 4
+# Moves a rollout plays before it is scored as a draw.
+ROLLOUT_DEPTH = 40
+# Chance that a rollout makes a four out of an own three, or blocks one of
+# the opponent's, when there is one.
+THREAT_RATE = 0.6
+# The tree stops growing at this many nodes; searching goes on in it.
+MAX_TREE_NODES = 200000
+# Seconds between progress reports.
+PROGRESS_INTERVAL = 0.25
+CANCEL_CHECK_INTERVAL = 16
+
+
+class Node:
+    # A move in the tree. wins counts rollouts won by color, the side that
+    # played the move, draws counting a half.
+    __slots__ = ("move", "color", "parent", "children", "untried", "visits", "wins", "winner")
+
+    def __init__(self, move, color, parent=None):
+        self.move = move
+        self.color = color
+        self.parent = parent
+        self.children = []
+        self.untried = None
+        self.visits = 0
+        self.wins = 0.0
+        # None, the winning color, or Color.NONE for a draw
+        self.winner = None
+
+
+class MCTS:
+    # Monte Carlo tree search over the moves of a Gomoku game, as the other
+    # engine next to minimax. Moves in the tree and in rollouts are played on
+    # the game's Bitboard through a ThreatSolver, whose window sets give the
+    # fives, fours and threes the rollout policy and the move generation
+    # need, and on its Candidates. The Evaluator is never touched. Between
+    # moves the subtree of the position reached is kept.
+    def __init__(self, game, seed=None):
+        self.game = game
+        self.random = random.Random(seed)
+        self.root = None
+        self.root_history = None
+        self.tree_nodes = 0
+
+
+    def opponent(self, color):
+        return Color.WHITE if color == Color.BLACK else Color.BLACK
+
+
+    def reuse_root(self, ai_color):
+        # The node of the current position in the last tree, if the moves
+        # played since are in it.
+        history = [move[:3] for move in self.game.history]
+        root = self.root
+        if root is None or root.color != self.opponent(ai_color) or self.root_history != history[:len(self.root_history)]:
+            root = None
+        else:
+            for x, y, color in history[len(self.root_history):]:
+                root = next((child for child in root.children if child.move == (x, y) and child.color == color), None)
+                if root is None:
+                    break
+        if root is None or root.color != self.opponent(ai_color):
+            root = Node(None, self.opponent(ai_color))
+            self.tree_nodes = 1
+        else:
+            root.parent = None
+            self.tree_nodes = self.count_nodes(root)
+        self.root = root
+        self.root_history = history
+        return root
+
+
+    def count_nodes(self, root):
+        count = 0
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            count += 1
+            stack.extend(node.children)
+        return count
+
+
+    def search(self, ai_color, time_limit=None, iterations=None, cancel=None, progress=None):
+        # Runs until the time or iterations are used up or cancel is set, and
+        # returns the root. Without either limit, MCTS_ITERATIONS are run.
+        start = time.perf_counter()
+        deadline = start + time_limit if time_limit is not None else None
+        if iterations is None and deadline is None:
+            iterations = MCTS_ITERATIONS
+        root = self.reuse_root(ai_color)
+        self.solver = ThreatSolver(self.game.board)
+        self.max_depth = 0
+
+        next_progress = start + PROGRESS_INTERVAL
+        done = 0
+        while iterations is None or done < iterations:
+            self.iterate(root)
+            done += 1
+            if done % CANCEL_CHECK_INTERVAL == 0:
+                now = time.perf_counter()
+                if cancel is not None and cancel.is_set():
+                    break
+                if deadline is not None and now >= deadline:
+                    break
+                if progress is not None and now >= next_progress:
+                    progress(root, self.max_depth, done)
+                    next_progress = now + PROGRESS_INTERVAL
+            if root.winner is not None:
+                break
+        self.iterations = done
+        return root
+
+
+    def iterate(self, root):
+        played = []
+        node = root
+        # Selection: UCT down through fully expanded nodes.
+        while node.winner is None and node.untried is not None and not node.untried and node.children:
+            node = self.select(node)
+            self.play(node.move, node.color, played)
+
+        # Expansion: the next untried move, best ordered first.
+        if node.winner is None:
+            if node.untried is None:
+                node.untried = self.moves(self.opponent(node.color))
+                if not node.untried:
+                    node.winner = Color.NONE
+            if node.untried and self.tree_nodes < MAX_TREE_NODES:
+                move = node.untried.pop()
+                child = Node(move, self.opponent(node.color), node)
+                node.children.append(child)
+                self.tree_nodes += 1
+                node = child
+                self.play(move, child.color, played)
+                if self.game.board.is_five(child.color, *move):
+                    child.winner = child.color
+        self.max_depth = max(self.max_depth, len(played))
+
+        # Simulation, scored for the side that played node's move.
+        if node.winner is not None:
+            reward = ROLLOUTS_PER_LEAF * self.score(node.winner, node.color)
+        else:
+            reward = 0.0
+            for _ in range(ROLLOUTS_PER_LEAF):
+                reward += self.score(self.rollout(self.opponent(node.color)), node.color)
+
+        # Backpropagation, the reward flipping sides at every level.
+        while node is not None:
+            node.visits += ROLLOUTS_PER_LEAF
+            node.wins += reward
+            reward = ROLLOUTS_PER_LEAF - reward
+            node = node.parent
+
+        for cell in reversed(played):
+            self.take(cell)
+
+
+    def select(self, node):
+        log_visits = math.log(node.visits)
+        best, best_value = None, float('-inf')
+        for child in node.children:
+            if child.winner == child.color:
+                return child
+            value = child.wins / child.visits + EXPLORATION * math.sqrt(log_visits / child.visits)
+            if value > best_value:
+                best, best_value = child, value
+        return best
+
+
+    def score(self, winner, color):
+        if winner == color:
+            return 1.0
+        if winner == Color.NONE:
+            return 0.5
+        return 0.0
+
+
+    def play(self, move, color, played):
+        board = self.game.board
+        cell = board.index(*move)
+        self.solver.place(cell, color)
+        self.game.candidates.place(cell)
+        played.append(cell)
+
+
+    def take(self, cell):
+        self.solver.remove(cell)
+        self.game.candidates.remove(cell)
+
+
+    def moves(self, color):
+        # Moves to expand, the most promising last: a five if there is one,
+        # else the blocks of the opponent's fives, else every candidate in
+        # the order minimax would try them.
+        solver = self.solver
+        board = self.game.board
+        wins = solver.five_points(color)
+        if wins:
+            return [board.cell(min(wins))]
+        threats = solver.five_points(self.opponent(color))
+        if threats:
+            return sorted(board.cell(cell) for cell in threats)
+        moves = list(board.cells(self.game.candidate_mask()))
+        moves = self.game.orderer.order(board, moves, color, 0)
+        moves.reverse()
+        return moves
+
+
+    def rollout(self, color):
+        # Plays from the current position with the threat policy and returns
+        # the winner, or Color.NONE for a draw or a rollout cut short.
+        solver = self.solver
+        played = []
+        winner = Color.NONE
+        try:
+            for _ in range(ROLLOUT_DEPTH):
+                opponent = self.opponent(color)
+                wins = solver.five_points(color)
+                if wins:
+                    winner = color
+                    break
+                cell = None
+                threats = solver.five_points(opponent)
+                if threats:
+                    if len(threats) > 1:
+                        winner = opponent
+                        break
+                    cell = next(iter(threats))
+                else:
+                    cell = self.threat_cell(color) or self.threat_cell(opponent)
+                if cell is None:
+                    cell = self.random_cell()
+                    if cell is None:
+                        break
+                solver.place(cell, color)
+                self.game.candidates.place(cell)
+                played.append(cell)
+                color = opponent
+        finally:
+            for cell in reversed(played):
+                self.take(cell)
+        return winner
+
+
+    def threat_cell(self, color):
+        # An empty cell of one of color's three-stone windows, some of the
+        # time: a four for color, or a block against it.
+        windows = self.solver.levels[color][3]
+        if not windows or self.random.random() >= THREAT_RATE:
+            return None
+        window = self.random.choice(tuple(windows))
+        return self.random.choice(self.solver.empty_cells(window))
+
+
+    def random_cell(self):
+        mask = self.game.candidate_mask()
+        count = mask.bit_count()
+        if not count:
+            return None
+        for _ in range(self.random.randrange(count)):
+            mask &= mask - 1
+        return (mask & -mask).bit_length() - 1
+
+
+    def best_child(self, root):
+        # The most visited move, as (child, win rate).
+        child = max(root.children, key=lambda child: (child.winner == child.color, child.visits))
+        return child, child.wins / child.visits
+
+
+    def root_counts(self, root):
+        return {child.move: (child.visits, child.wins) for child in root.children}
@@ -0,0 +1,91 @@
+from Color import Color
+
+# Ordering weight of a five-cell window holding k stones of one color and
+# none of the other, for the side that owns it and for the side that would
+# block it. A window of four is a win or a forced block, a window of three is
+# a four or an open three in the making.
+OWN_WEIGHTS = [0, 2, 12, 1000, 10 ** 7]
+BLOCK_WEIGHTS = [0, 1, 10, 500, 10 ** 6]
+KILLER_SLOTS = 2
+
+
+class MoveOrderer:
+    # Ranks candidate moves for alpha-beta: threats read from the window
+    # counts of the Bitboard first, then killer moves of the same ply, then
+    # the history score of moves that caused cutoffs earlier.
+    def __init__(self, geometry):
+        self.stride = geometry.stride
+        self.cell_windows = geometry.cell_windows
+
+        # window count (black + 8 * white) -> weight for black or white to move
+        self.black_weights = [0] * 46
+        self.white_weights = [0] * 46
+        for count in range(46):
+            black, white = count & 7, count >> 3
+            if black > 4 or white > 4:
+                continue
+            if white == 0:
+                self.black_weights[count] += OWN_WEIGHTS[black]
+                self.white_weights[count] += BLOCK_WEIGHTS[black]
+            if black == 0:
+                self.white_weights[count] += OWN_WEIGHTS[white]
+                self.black_weights[count] += BLOCK_WEIGHTS[white]
+
+        self.black_history = [0] * geometry.cell_count
+        self.white_history = [0] * geometry.cell_count
+        self.killers = []
+
+
+    def new_search(self):
+        for history in (self.black_history, self.white_history):
+            for index, score in enumerate(history):
+                if score:
+                    history[index] = score >> 1
+        self.killers = []
+
+
+    def threat_score(self, counts, x, y, color):
+        weights = self.black_weights if color is Color.BLACK else self.white_weights
+        score = 0
+        for window in self.cell_windows[x * self.stride + y]:
+            score += weights[counts[window]]
+        return score
+
+
+    def order(self, board, moves, color, ply, tt_move=None, threats=True):
+        stride = self.stride
+        history = self.black_history if color is Color.BLACK else self.white_history
+        killers = self.killers[ply] if ply < len(self.killers) else ()
+
+        if threats:
+            counts = board.counts
+            cell_windows = self.cell_windows
+            weights = self.black_weights if color is Color.BLACK else self.white_weights
+
+            def key(move):
+                index = move[0] * stride + move[1]
+                threat = 0
+                for window in cell_windows[index]:
+                    threat += weights[counts[window]]
+                return threat, move in killers, history[index]
+        else:
+            def key(move):
+                return move in killers, history[move[0] * stride + move[1]]
+
+        moves.sort(key=key, reverse=True)
+        if tt_move is not None and tt_move in moves:
+            moves.remove(tt_move)
+            moves.insert(0, tt_move)
+        return moves
+
+
+    def record_cutoff(self, move, color, ply, depth):
+        history = self.black_history if color is Color.BLACK else self.white_history
+        history[move[0] * self.stride + move[1]] += depth * depth
+
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[KILLER_SLOTS:]
@@ -0,0 +1,229 @@
+import argparse
+import bisect
+import mmap
+import os
+import struct
+import time
+from Color import Color
+
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+BOOK_MAGIC = b"GBK1"
+# magic, board size, most stones in a booked position, record count
+HEADER = struct.Struct("<4sHHI")
+# canonical key, move cell (or COLOR_CHOICE | color), search score
+RECORD = struct.Struct("<QHh")
+COLOR_CHOICE = 0x8000
+# Mixed into the key of a Swap2 color choice, which shares its position
+# with the first move played after it.
+SWAP_KEY = 0x5BD1E9955BD1E995
+
+# Defaults for building: search depth, player replies tried per position
+# and AI moves deep.
+BOOK_DEPTH = 5
+BOOK_REPLIES = 6
+BOOK_AI_MOVES = 2
+
+# (x, y) -> (x, y) for the 8 symmetries of the board, n = size - 1
+SYMMETRIES = [
+    lambda x, y, n: (x, y),
+    lambda x, y, n: (n - x, y),
+    lambda x, y, n: (x, n - y),
+    lambda x, y, n: (n - x, n - y),
+    lambda x, y, n: (y, x),
+    lambda x, y, n: (n - y, x),
+    lambda x, y, n: (y, n - x),
+    lambda x, y, n: (n - y, n - x),
+]
+INVERSE = [0, 1, 2, 3, 4, 6, 5, 7]
+
+
+def canonical(board):
+    # The smallest Zobrist hash of the position over all symmetries, and
+    # the symmetry that gives it.
+    n = board.size - 1
+    stride = board.stride
+    black = list(board.cells(board.black))
+    white = list(board.cells(board.white))
+    best = None
+    for symmetry, transform in enumerate(SYMMETRIES):
+        key = 0
+        for x, y in black:
+            tx, ty = transform(x, y, n)
+            key ^= board.black_keys[tx * stride + ty]
+        for x, y in white:
+            tx, ty = transform(x, y, n)
+            key ^= board.white_keys[tx * stride + ty]
+        if best is None or key < best[0]:
+            best = (key, symmetry)
+    return best
+
+
+class OpeningBook:
+    # Moves and Swap2 color choices for early positions, searched deeper
+    # than the game can afford. Positions that are mirror or rotated images
+    # of each other share one record, with the move stored for the
+    # canonical orientation. The file is a header and records sorted by
+    # key, memory-mapped and binary searched on first use.
+    def __init__(self, path=BOOK_PATH):
+        self.path = path
+        self.data = None
+        self.keys = None
+        self.max_stones = 0
+
+
+    def load(self):
+        if self.data is not None:
+            return self.keys is not None
+        self.data = b""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "rb") as book:
+            self.data = mmap.mmap(book.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, size, self.max_stones, count = HEADER.unpack_from(self.data, 0)
+        if magic != BOOK_MAGIC:
+            raise ValueError(f"{self.path} is not an opening book")
+        self.size = size
+        self.count = count
+        self.keys = KeyView(self.data, count)
+        return True
+
+
+    def record(self, key):
+        index = bisect.bisect_left(self.keys, key)
+        if index < self.count and self.keys[index] == key:
+            return RECORD.unpack_from(self.data, HEADER.size + index * RECORD.size)
+        return None
+
+
+    def lookup(self, board, swap=False):
+        if not self.load() or board.size != self.size or board.stone_count() > self.max_stones:
+            return None, None
+        key, symmetry = canonical(board)
+        record = self.record(key ^ SWAP_KEY if swap else key)
+        return record, symmetry
+
+
+    def move(self, board):
+        record, symmetry = self.lookup(board)
+        if record is None or record[1] & COLOR_CHOICE:
+            return None
+        x, y = divmod(record[1], board.size)
+        x, y = SYMMETRIES[INVERSE[symmetry]](x, y, board.size - 1)
+        if not board.is_empty(x, y):
+            return None
+        return x, y
+
+
+    def color_choice(self, board):
+        record, _ = self.lookup(board, swap=True)
+        if record is None or not record[1] & COLOR_CHOICE:
+            return None
+        return Color(record[1] & ~COLOR_CHOICE)
+
+
+class KeyView:
+    # The record keys as a sequence, for bisect.
+    def __init__(self, data, count):
+        self.data = data
+        self.count = count
+
+
+    def __len__(self):
+        return self.count
+
+
+    def __getitem__(self, index):
+        return struct.unpack_from("<Q", self.data, HEADER.size + index * RECORD.size)[0]
+
+
+def write_book(path, size, max_stones, entries):
+    with open(path, "wb") as book:
+        book.write(HEADER.pack(BOOK_MAGIC, size, max_stones, len(entries)))
+        for key in sorted(entries):
+            value, score = entries[key]
+            book.write(RECORD.pack(key, value, max(-32768, min(32767, int(score)))))
+
+
+def side_to_move(board):
+    return Color.WHITE if board.black.bit_count() > board.white.bit_count() else Color.BLACK
+
+
+def build_book(path=BOOK_PATH, depth=BOOK_DEPTH, replies=BOOK_REPLIES, ai_moves=BOOK_AI_MOVES):
+    # From every opening, with the AI on either side: the AI's searched move
+    # whenever it is to move, and the player's best few replies otherwise,
+    # for ai_moves AI moves. Then the Swap2 color choice for every way of
+    # adding a black and a white stone next to the opening stones.
+    from Gomoku import Gomoku
+    from Openings import OPENINGS
+
+    entries = {}
+    max_stones = 0
+
+    def explore(game, moves_left):
+        nonlocal max_stones
+        board = game.board
+        ai_color = game.get_opposite_color(game.player_color)
+        if side_to_move(board) == ai_color:
+            key, symmetry = canonical(board)
+            if key not in entries:
+                result = game.find_best_move()
+                x, y = SYMMETRIES[symmetry](result.move[0], result.move[1], board.size - 1)
+                entries[key] = (x * board.size + y, result.score or 0)
+                max_stones = max(max_stones, board.stone_count())
+            x, y = divmod(entries[key][0], board.size)
+            x, y = SYMMETRIES[INVERSE[symmetry]](x, y, board.size - 1)
+            if moves_left > 1:
+                game.make_search_move(x, y, ai_color)
+                if not board.is_five(ai_color, x, y):
+                    explore(game, moves_left - 1)
+                game.unmake_search_move(x, y)
+            return
+
+        for x, y in game.order_moves(game.player_color, 0)[:replies]:
+            game.make_search_move(x, y, game.player_color)
+            if not board.is_five(game.player_color, x, y):
+                explore(game, moves_left)
+            game.unmake_search_move(x, y)
+
+    for number, opening in enumerate(OPENINGS):
+        start = time.perf_counter()
+        for ai_color in (Color.WHITE, Color.BLACK):
+            game = Gomoku(verbose=False, max_depth=depth, opening_book=False)
+            for x, y, color in opening:
+                game.make_move(x, y, color, initial=True)
+            game.player_color = game.get_opposite_color(ai_color)
+            explore(game, ai_moves)
+
+        game = Gomoku(verbose=False, opening_book=False)
+        for x, y, color in opening:
+            game.make_move(x, y, color, initial=True)
+        cells = game.candidate_moves()
+        for black in cells:
+            game.make_search_move(black[0], black[1], Color.BLACK)
+            for white in cells:
+                if white == black:
+                    continue
+                game.make_search_move(white[0], white[1], Color.WHITE)
+                key = canonical(game.board)[0] ^ SWAP_KEY
+                if key not in entries:
+                    black_value = game.evaluate_starting(Color.BLACK)
+                    white_value = game.evaluate_starting(Color.WHITE)
+                    color = Color.BLACK if black_value >= white_value else Color.WHITE
+                    entries[key] = (COLOR_CHOICE | color.value, black_value - white_value)
+                    max_stones = max(max_stones, game.board.stone_count())
+                game.unmake_search_move(white[0], white[1])
+            game.unmake_search_move(black[0], black[1])
+        print(f"opening {number}: {len(entries)} records, {time.perf_counter() - start:.1f} s")
+
+    write_book(path, game.board.size, max_stones, entries)
+    return len(entries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the opening book.")
+    parser.add_argument("--output", default=BOOK_PATH)
+    parser.add_argument("--depth", type=int, default=BOOK_DEPTH)
+    parser.add_argument("--replies", type=int, default=BOOK_REPLIES)
+    parser.add_argument("--ai-moves", type=int, default=BOOK_AI_MOVES)
+    args = parser.parse_args()
+    print(build_book(args.output, args.depth, args.replies, args.ai_moves), "records written")
@@ -0,0 +1,22 @@
+from Color import Color
+
+# The openings are laid out around the center of a 15x15 board.
+OPENING_CENTER = 7
+
+# Three-stone swap2 starts: two black stones and one white, white to move.
+OPENINGS = [
+    [(7, 7, Color.BLACK), (7, 8, Color.BLACK), (8, 7, Color.WHITE)],
+    [(7, 7, Color.BLACK), (8, 8, Color.BLACK), (6, 6, Color.WHITE)],
+    [(7, 7, Color.BLACK), (7, 8, Color.BLACK), (7, 6, Color.WHITE)],
+    [(7, 7, Color.BLACK), (8, 7, Color.BLACK), (6, 7, Color.WHITE)],
+    [(7, 7, Color.BLACK), (8, 7, Color.BLACK), (7, 8, Color.WHITE)],
+    [(5, 6, Color.BLACK), (8, 9, Color.BLACK), (7, 7, Color.WHITE)],
+    [(6, 6, Color.BLACK), (8, 7, Color.BLACK), (8, 6, Color.WHITE)],
+    [(6, 7, Color.BLACK), (9, 7, Color.BLACK), (7, 7, Color.WHITE)]
+]
+
+
+def centered(opening, size):
+    # The opening moved to the center of a board of the given size.
+    shift = size // 2 - OPENING_CENTER
+    return [(x + shift, y + shift, color) for x, y, color in opening]
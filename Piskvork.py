@@ -0,0 +1,216 @@
+import os
+import sys
+import time
+from Color import Color
+from Evaluator import MAX_CACHED_LINES
+from Gomoku import Gomoku, SEARCH_DEPTH
+from OpeningBook import BOOK_PATH
+from ThreatSolver import VCF_NODE_LIMIT
+from TranspositionTable import TranspositionTable, TT_SIZE
+
+ABOUT = 'name="Gomoku", version="1.0"'
+MIN_SIZE = 5
+# Depth cap when a time limit decides how deep to search.
+TIMED_MAX_DEPTH = 12
+# Share of the time allowed for a move that the search is given: depth 1
+# and the threat solver are not cut short, and the manager counts the
+# reply too.
+TIME_SAFETY = 0.6
+# Moves still to play, for spreading the match time left.
+MOVES_LEFT = 25
+# Memory taken before the caches, and per transposition table slot and
+# cached line score.
+BASE_MEMORY = 40 << 20
+TT_ENTRY_MEMORY = 240
+LINE_ENTRY_MEMORY = 160
+# Per position the threat solver remembers as failed. A solve starts
+# afresh and remembers at most VCF_NODE_LIMIT of them.
+FAILED_ENTRY_MEMORY = 120
+MIN_TT_SIZE = 1 << 12
+MIN_CACHED_LINES = 1 << 12
+# Share of the memory left for the caches that the transposition table gets.
+TT_SHARE = 0.75
+
+
+class PiskvorkEngine:
+    # The Gomocup (piskvork) protocol on top of a Gomoku game: commands come
+    # in one per line, answers go out one per line. The AI is always the
+    # side to move when asked for a move, and its color follows from the
+    # stone counts, black moving first.
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.game = None
+        self.board_lines = None
+        self.timeout_turn = None
+        self.timeout_match = None
+        self.time_left = None
+        self.max_memory = None
+
+
+    def send(self, line):
+        self.out.write(line + "\n")
+        self.out.flush()
+
+
+    def run(self, stream=sys.stdin):
+        for line in stream:
+            if not self.handle(line.strip()):
+                break
+
+
+    def handle(self, line):
+        # False once the manager ends the session.
+        if not line:
+            return True
+        command, _, argument = line.partition(" ")
+        command = command.upper()
+        try:
+            if self.board_lines is not None:
+                if command == "DONE":
+                    self.finish_board()
+                else:
+                    self.board_lines.append(line)
+            elif command == "END":
+                return False
+            elif command == "START":
+                self.start(int(argument))
+            elif command == "RECTSTART":
+                self.send("ERROR only square boards are supported")
+            elif command == "RESTART":
+                self.start(self.game.board_size)
+            elif command == "INFO":
+                self.info(*argument.split(None, 1))
+            elif command == "BEGIN":
+                self.play_move()
+            elif command == "TURN":
+                x, y = self.parse_cell(argument)
+                if not self.game.is_valid(x, y):
+                    raise ValueError(f"{x},{y} is taken")
+                self.place(x, y, self.side_to_move())
+                self.play_move()
+            elif command == "BOARD":
+                self.board_lines = []
+            elif command == "TAKEBACK":
+                self.game.take_back(*self.parse_cell(argument))
+                self.send("OK")
+            elif command == "ABOUT":
+                self.send(ABOUT)
+            else:
+                self.send("UNKNOWN " + command)
+        except (ValueError, TypeError, AttributeError) as error:
+            self.send(f"ERROR {error}")
+        return True
+
+
+    def start(self, size):
+        if size < MIN_SIZE:
+            self.send("ERROR unsupported size")
+            return
+        tt_size, line_cache_size = self.cache_sizes()
+        self.game = Gomoku(verbose=False, board_size=size, tt_size=tt_size, line_cache_size=line_cache_size)
+        self.send("OK")
+
+
+    def cache_sizes(self):
+        # Transposition table slots, a power of two, and cached line scores
+        # that fit the memory limit after the fixed costs: the interpreter
+        # and board tables, the mapped opening book and the positions the
+        # threat solver remembers.
+        if not self.max_memory:
+            return TT_SIZE, MAX_CACHED_LINES
+        left = self.max_memory - BASE_MEMORY - VCF_NODE_LIMIT * FAILED_ENTRY_MEMORY
+        if os.path.exists(BOOK_PATH):
+            left -= os.path.getsize(BOOK_PATH)
+        tt_size = TT_SIZE
+        while tt_size > MIN_TT_SIZE and tt_size * TT_ENTRY_MEMORY > left * TT_SHARE:
+            tt_size >>= 1
+        lines = (left - tt_size * TT_ENTRY_MEMORY) // LINE_ENTRY_MEMORY
+        return tt_size, max(MIN_CACHED_LINES, min(MAX_CACHED_LINES, lines))
+
+
+    def info(self, key, value=""):
+        # Times are in milliseconds, 0 meaning no limit for the match and
+        # as fast as possible for a turn. Other keys are ignored.
+        key = key.lower()
+        if key == "timeout_turn":
+            self.timeout_turn = int(value)
+        elif key == "timeout_match":
+            self.timeout_match = int(value)
+        elif key == "time_left":
+            self.time_left = int(value)
+        elif key == "max_memory":
+            self.max_memory = int(value)
+            if self.game is not None:
+                tt_size, line_cache_size = self.cache_sizes()
+                if self.game.tt.size != tt_size:
+                    self.game.tt = TranspositionTable(tt_size)
+                self.game.line_cache_size = line_cache_size
+                self.game.evaluator.max_cached_lines = line_cache_size
+
+
+    def move_time(self):
+        # Seconds for the next move, or None without a time limit.
+        limits = []
+        if self.timeout_turn is not None:
+            limits.append(self.timeout_turn)
+        if self.timeout_match and self.time_left is not None:
+            limits.append(self.time_left / MOVES_LEFT)
+        if not limits:
+            return None
+        return max(min(limits), 0) * TIME_SAFETY / 1000
+
+
+    def parse_cell(self, argument):
+        x, y = (int(value) for value in argument.split(",")[:2])
+        if not self.game.in_range(x, y):
+            raise ValueError(f"{x},{y} is off the board")
+        return x, y
+
+
+    def side_to_move(self):
+        board = self.game.board
+        return Color.WHITE if board.black.bit_count() > board.white.bit_count() else Color.BLACK
+
+
+    def place(self, x, y, color):
+        # The manager decides when a game is over; until it says so, every
+        # move it reports is played.
+        self.game.make_move(x, y, color, initial=True)
+        self.game.game_over = False
+
+
+    def finish_board(self):
+        lines, self.board_lines = self.board_lines, None
+        stones = {1: [], 2: []}
+        for line in lines:
+            x, y, field = (int(value) for value in line.split(","))
+            if field in stones:
+                stones[field].append((x, y))
+        self.game.initialize_game()
+        # Own stones are black when both sides have as many, the AI being
+        # to move.
+        own = Color.BLACK if len(stones[1]) == len(stones[2]) else Color.WHITE
+        opponent = self.game.get_opposite_color(own)
+        for field, color in ((1, own), (2, opponent)):
+            for x, y in stones[field]:
+                self.place(x, y, color)
+        self.play_move()
+
+
+    def play_move(self):
+        game = self.game
+        ai_color = self.side_to_move()
+        game.player_color = game.get_opposite_color(ai_color)
+        game.time_limit = self.move_time()
+        game.max_depth = TIMED_MAX_DEPTH if game.time_limit is not None else SEARCH_DEPTH
+        start = time.perf_counter()
+        result = game.find_best_move()
+        x, y = result.move
+        self.place(x, y, ai_color)
+        if self.time_left is not None:
+            self.time_left -= int((time.perf_counter() - start) * 1000)
+        self.send(f"{x},{y}")
+
+
+if __name__ == "__main__":
+    PiskvorkEngine().run()
@@ -0,0 +1,144 @@
+import mmap
+import os
+import struct
+import zlib
+
+CACHE_MAGIC = b"GSC1"
+# magic, bucket count, search generation
+HEADER = struct.Struct("<4sIQ")
+HEADER_SIZE = 64
+# check, score bits, info: check is the key XOR the other two words
+SLOT = struct.Struct("<QQQ")
+BUCKET_SLOTS = 4
+BUCKET = struct.Struct("<" + "QQQ" * BUCKET_SLOTS)
+SCORE = struct.Struct("<d")
+CACHE_BUCKETS = 1 << 18
+# Searches after which an entry gives way to any new one.
+CACHE_AGE = 64
+# Nodes with less depth left stay in the transposition table only.
+CACHE_MIN_DEPTH = 1
+
+# info: bit 0 set when the slot is used, bits 1-2 the flag, bit 3 set when
+# the score was an int, bits 8-15 the depth, bits 16-31 the move as x + 1
+# and y + 1 (0 for none), bits 32-63 the generation
+VALID = 1
+INTEGER = 8
+GENERATION_MASK = 0xFFFFFFFF
+KEY_MASK = 0xFFFFFFFFFFFFFFFF
+
+
+def option_key(board_size, candidate_radius, width_limit):
+    # Mixed into every key, so engines whose searches score positions
+    # differently never read each other's entries.
+    text = f"{board_size},{candidate_radius},{width_limit}".encode()
+    return (zlib.crc32(text) * 0x9E3779B97F4A7C15) & KEY_MASK
+
+
+class SearchCache:
+    # Search results by position key in a memory-mapped file, for every
+    # engine process on the host and across restarts. Slots come in buckets
+    # of BUCKET_SLOTS, bucket key % buckets. There are no locks: a slot is
+    # written in one go and stores the key XORed with its data, so a slot
+    # torn by two writers, or read halfway through a write, no longer
+    # matches its key and reads as a miss. A store replaces the entry of the
+    # same position unless that one is deeper, else takes an empty slot of
+    # the bucket, else an entry untouched for CACHE_AGE searches, else the
+    # shallowest entry if it is not deeper than the new one.
+    def __init__(self, path, buckets=CACHE_BUCKETS):
+        self.path = path
+        self.hits = 0
+        self.stores = 0
+        # Never truncated: other processes may have the file mapped.
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+        try:
+            header = os.read(fd, HEADER.size)
+            if not header.strip(b"\0"):
+                # A new file. Processes creating it at once all write the
+                # same header.
+                header = HEADER.pack(CACHE_MAGIC, buckets, 0)
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.write(fd, header)
+            if len(header) < HEADER.size or HEADER.unpack(header)[0] != CACHE_MAGIC:
+                raise ValueError(f"{path} is not a search cache")
+            buckets = HEADER.unpack(header)[1]
+            length = HEADER_SIZE + buckets * BUCKET.size
+            if os.fstat(fd).st_size < length:
+                os.ftruncate(fd, length)
+            self.data = mmap.mmap(fd, length)
+        finally:
+            os.close(fd)
+        self.buckets = buckets
+        self.size = buckets * BUCKET_SLOTS
+        self.generation = 0
+
+
+    def new_search(self):
+        # The generation is shared; racing searches may take the same one.
+        self.generation = (HEADER.unpack_from(self.data, 0)[2] + 1) & GENERATION_MASK
+        struct.pack_into("<Q", self.data, 8, self.generation)
+
+
+    def join_search(self):
+        # Takes the generation of a search started in another process.
+        self.generation = HEADER.unpack_from(self.data, 0)[2] & GENERATION_MASK
+
+
+    def offset(self, key):
+        return HEADER_SIZE + key % self.buckets * BUCKET.size
+
+
+    def probe(self, key):
+        # (key, depth, flag, score, move, generation) like the
+        # transposition table, or None.
+        words = BUCKET.unpack_from(self.data, self.offset(key))
+        for i in range(0, len(words), 3):
+            check, bits, info = words[i:i + 3]
+            if info & VALID and check ^ bits ^ info == key:
+                self.hits += 1
+                move = None
+                if info >> 16 & 0xFFFF:
+                    move = ((info >> 16 & 0xFF) - 1, (info >> 24 & 0xFF) - 1)
+                score = SCORE.unpack(bits.to_bytes(8, "little"))[0]
+                if info & INTEGER:
+                    score = int(score)
+                return key, info >> 8 & 0xFF, info >> 1 & 3, score, move, info >> 32
+        return None
+
+
+    def store(self, key, depth, flag, score, move):
+        offset = self.offset(key)
+        words = BUCKET.unpack_from(self.data, offset)
+        slot, victim_rank = None, None
+        for i in range(0, len(words), 3):
+            check, bits, info = words[i:i + 3]
+            if info & VALID and check ^ bits ^ info == key:
+                if depth < info >> 8 & 0xFF:
+                    return
+                slot, victim_rank = i, None
+                break
+            # empty slots first, then stale ones, then the shallowest
+            rank = (0, 0)
+            if info & VALID:
+                fresh = (self.generation - (info >> 32)) & GENERATION_MASK < CACHE_AGE
+                rank = (1 + fresh, info >> 8 & 0xFF)
+            if slot is None or rank < victim_rank:
+                slot, victim_rank = i, rank
+        if victim_rank is not None and victim_rank[0] == 2 and victim_rank[1] > depth:
+            return
+
+        info = VALID | flag << 1 | min(depth, 0xFF) << 8 | self.generation << 32
+        if move is not None:
+            info |= (move[0] + 1) << 16 | (move[1] + 1) << 24
+        if isinstance(score, int):
+            info |= INTEGER
+        bits = int.from_bytes(SCORE.pack(score), "little")
+        SLOT.pack_into(self.data, offset + slot // 3 * SLOT.size, key ^ bits ^ info, bits, info)
+        self.stores += 1
+
+
+    def best_move(self, key):
+        entry = self.probe(key)
+        if entry is None:
+            return None
+        return entry[4]
+
@@ -0,0 +1,94 @@
+import time
+
+# Parts of a search that are timed when timing is switched on.
+TIMED_PARTS = ["move_generation", "evaluation", "win_checks"]
+
+
+class SearchStats:
+    # What one find_best_move did. Node, leaf and cutoff counts are always
+    # kept; the time per part only with Gomoku(timing=True), which wraps the
+    # methods doing that work for the length of the search.
+    def __init__(self, max_depth):
+        self.move = None
+        self.score = None
+        self.depth = 0
+        self.nodes = 0
+        self.leaves = 0
+        self.tt_hits = 0
+        # hits in the shared search cache, see SearchCache
+        self.cache_hits = 0
+        self.time = 0.0
+        self.pv = []
+        # index = plies from the root, root moves are ply 0
+        self.ply_nodes = [0] * (max_depth + 1)
+        self.ply_cutoffs = [0] * (max_depth + 1)
+        self.times = {part: 0.0 for part in TIMED_PARTS}
+
+
+    def grow(self, depth):
+        while len(self.ply_nodes) <= depth:
+            self.ply_nodes.append(0)
+            self.ply_cutoffs.append(0)
+
+
+    def merge(self, other):
+        # Adds the counts of a search made elsewhere, e.g. in a worker process.
+        self.grow(len(other.ply_nodes) - 1)
+        for ply, nodes in enumerate(other.ply_nodes):
+            self.ply_nodes[ply] += nodes
+            self.ply_cutoffs[ply] += other.ply_cutoffs[ply]
+        self.leaves += other.leaves
+        self.tt_hits += other.tt_hits
+        self.cache_hits += other.cache_hits
+        for part, seconds in other.times.items():
+            self.times[part] += seconds
+
+
+    def timed(self, part, method):
+        times = self.times
+
+        def timed_method(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                times[part] += time.perf_counter() - start
+        return timed_method
+
+
+    def branching_factors(self):
+        # Nodes at the next ply per node at this one, all iterations together.
+        factors = []
+        for ply in range(len(self.ply_nodes) - 1):
+            if self.ply_nodes[ply] and self.ply_nodes[ply + 1]:
+                factors.append(self.ply_nodes[ply + 1] / self.ply_nodes[ply])
+        return factors
+
+
+    def to_dict(self):
+        return {
+            "move": self.move,
+            "score": self.score,
+            "depth": self.depth,
+            "nodes": self.nodes,
+            "leaves": self.leaves,
+            "tt_hits": self.tt_hits,
+            "cache_hits": self.cache_hits,
+            "time": self.time,
+            "nodes_per_sec": self.nodes / self.time if self.time else 0.0,
+            "pv": self.pv,
+            "ply_nodes": self.ply_nodes,
+            "ply_cutoffs": self.ply_cutoffs,
+            "branching_factors": self.branching_factors(),
+            "times": self.times,
+        }
+
+
+    def summary(self):
+        text = (f"move {self.move} score {self.score} depth {self.depth} nodes {self.nodes} "
+                f"leaves {self.leaves} tt hits {self.tt_hits} time {self.time * 1000:.1f} ms")
+        if self.pv:
+            text += " pv " + " ".join(f"{x},{y}" for x, y in self.pv)
+        if any(self.times.values()):
+            text += " | " + " ".join(f"{part} {seconds * 1000:.1f} ms" for part, seconds in self.times.items())
+        return text
@@ -0,0 +1,148 @@
+import argparse
+import json
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from Candidates import CANDIDATE_RADIUS
+from Color import Color
+from Gomoku import Gomoku, BOARD_SIZE, SEARCH_DEPTH
+from MCTS import MCTS_ITERATIONS
+from Openings import OPENINGS, centered
+
+# Engine options that can be set per side, as --a-<option> and --b-<option>.
+ENGINE_OPTIONS = [
+    ("max_depth", int, SEARCH_DEPTH),
+    ("time_limit", float, None),
+    ("node_limit", int, None),
+    ("width_limit", int, None),
+    ("batch_eval", bool, False),
+    ("threat_solver", bool, True),
+    ("candidate_radius", int, CANDIDATE_RADIUS),
+    ("opening_book", bool, True),
+    ("engine", str, "minimax"),
+    ("mcts_iterations", int, MCTS_ITERATIONS),
+    ("search_cache", str, None),
+]
+
+
+def engine_config(args, side):
+    config = {name: getattr(args, f"{side}_{name}") for name, _, _ in ENGINE_OPTIONS}
+    config["board_size"] = args.board_size
+    return config
+
+
+def play_self_game(number, config_a, config_b):
+    # Every game starts from an opening, taken in turn, and the engines
+    # swap colors from one game to the next. Each engine keeps its own
+    # game and is told the other's moves.
+    opening = number % len(OPENINGS)
+    a_color = Color.BLACK if number % 2 == 0 else Color.WHITE
+    engines = {a_color: Gomoku(verbose=False, **config_a)}
+    b_color = Color.WHITE if a_color == Color.BLACK else Color.BLACK
+    engines[b_color] = Gomoku(verbose=False, **config_b)
+    for color, engine in engines.items():
+        engine.player_color = engine.get_opposite_color(color)
+
+    moves = []
+    size = engines[a_color].board.size
+    for x, y, color in centered(OPENINGS[opening], size):
+        for engine in engines.values():
+            engine.make_move(x, y, color, initial=True)
+        moves.append([x, y, color.name])
+
+    times = []
+    nodes = []
+    to_move = Color.WHITE
+    winner = None
+    while len(moves) < size * size:
+        engine = engines[to_move]
+        start_time = time.perf_counter()
+        result = engine.find_best_move()
+        times.append(round(time.perf_counter() - start_time, 4))
+        nodes.append(result.nodes)
+
+        x, y = result.move
+        for other in engines.values():
+            other.make_move(x, y, to_move)
+        moves.append([x, y, to_move.name])
+        if engine.game_over:
+            if engine.board.is_five(to_move, x, y):
+                winner = "A" if to_move == a_color else "B"
+            break
+        to_move = engine.get_opposite_color(to_move)
+
+    for engine in engines.values():
+        engine.close()
+    return {
+        "game": number,
+        "opening": opening,
+        "black": "A" if a_color == Color.BLACK else "B",
+        "winner": winner or "draw",
+        "moves": moves,
+        "times": times,
+        "nodes": nodes,
+    }
+
+
+def elo_difference(score):
+    # Elo of A over B for an expected score, capped for clean sweeps.
+    score = min(max(score, 0.001), 0.999)
+    return -400 * math.log10(1 / score - 1)
+
+
+def summarize(results):
+    games = len(results)
+    wins = sum(1 for result in results if result["winner"] == "A")
+    losses = sum(1 for result in results if result["winner"] == "B")
+    draws = games - wins - losses
+    score = (wins + draws / 2) / games
+
+    # 95% interval from the spread of the per-game scores
+    variance = (wins * (1 - score) ** 2 + losses * score ** 2 + draws * (0.5 - score) ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    return {
+        "games": games,
+        "wins": wins,
+        "losses": losses,
+        "draws": draws,
+        "score": score,
+        "elo": elo_difference(score),
+        "elo_low": elo_difference(score - margin),
+        "elo_high": elo_difference(score + margin),
+    }
+
+
+def run_tournament(games, config_a, config_b, output, workers=None):
+    results = []
+    with ProcessPoolExecutor(workers) as pool, open(output, "w") as out:
+        futures = [pool.submit(play_self_game, number, config_a, config_b) for number in range(games)]
+        for future in as_completed(futures):
+            result = future.result()
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            results.append(result)
+            print(f"game {result['game']}: winner {result['winner']} in {len(result['moves'])} moves")
+    return summarize(results)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Play two engine configurations against each other.")
+    parser.add_argument("--games", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=None, help="processes, one per CPU by default")
+    parser.add_argument("--output", default="selfplay.jsonl")
+    parser.add_argument("--board-size", type=int, default=BOARD_SIZE)
+    for side in ("a", "b"):
+        for name, kind, default in ENGINE_OPTIONS:
+            option = f"--{side}-{name.replace('_', '-')}"
+            if kind is bool:
+                parser.add_argument(option, action=argparse.BooleanOptionalAction, default=default)
+            else:
+                parser.add_argument(option, type=kind, default=default)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    summary = run_tournament(args.games, engine_config(args, "a"), engine_config(args, "b"), args.output, args.workers)
+    print(f"A {summary['wins']} - B {summary['losses']} - draws {summary['draws']}, score {summary['score']:.3f}")
+    print(f"Elo A - B: {summary['elo']:+.0f} ({summary['elo_low']:+.0f} to {summary['elo_high']:+.0f})")
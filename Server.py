@@ -0,0 +1,346 @@
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import random
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from Bitboard import Bitboard
+from Color import Color
+from Gomoku import Gomoku, SearchTimeout, BOARD_SIZE, SEARCH_DEPTH
+from Openings import OPENINGS, centered
+
+HOST = "127.0.0.1"
+PORT = 8765
+# Board sizes a game may ask for. Larger boards would make every game cost
+# seconds of table building; GameRecord names the columns of up to 26 by a
+# single letter.
+MIN_SIZE = 5
+MAX_SIZE = 26
+# Seconds per AI move, by default and at most.
+TIME_LIMIT = 1.0
+MAX_TIME_LIMIT = 10.0
+# Moves still to play, for spreading a game's time budget.
+MOVES_LEFT = 25
+# AI moves waiting for a worker before new ones are turned away.
+MAX_QUEUE = 64
+# AI move latencies kept for the metrics.
+LATENCY_WINDOW = 1000
+# Games whose engine a worker process keeps between their moves.
+ENGINES_PER_WORKER = 4
+
+# The engines of a worker process by game id, least recently used first.
+_engines = OrderedDict()
+
+
+def engine_move(game_id, size, stones, to_move, options, time_limit):
+    # Runs in a worker process. Every game always goes to the same worker,
+    # which keeps its engine, so the transposition table carries over from
+    # one move to the next and only the stones played since are added.
+    game = _engines.pop(game_id, None)
+    if game is None:
+        game = Gomoku(verbose=False, board_size=size,
+                      **{name: value for name, value in options.items() if name != "max_depth"})
+    played = [(x, y, color.value) for x, y, color, _ in game.history]
+    if played != stones[:len(played)]:
+        game.initialize_game()
+        played = []
+    for x, y, color in stones[len(played):]:
+        game.make_move(x, y, Color(color), initial=True)
+    _engines[game_id] = game
+    while len(_engines) > ENGINES_PER_WORKER:
+        _engines.popitem(last=False)[1].close()
+
+    game.player_color = game.get_opposite_color(Color(to_move))
+    game.max_depth = options.get("max_depth", SEARCH_DEPTH)
+    game.time_limit = time_limit
+    try:
+        result = game.find_best_move()
+    except SearchTimeout:
+        return {"error": "no depth finished within the budget"}
+    return {"best_move": result.move, "score": result.score, "depth": result.depth}
+
+
+class GameSession:
+    # One hosted game. The server keeps the stones on a Bitboard for rule
+    # checks; the AI moves are searched by the engine of a worker, worker
+    # being the one the game prefers.
+    def __init__(self, game_id, board, player_color, time_limit, time_budget, worker):
+        self.id = game_id
+        self.board = board
+        self.worker = worker
+        self.stones = []
+        self.player_color = player_color
+        self.time_limit = time_limit
+        self.time_left = time_budget
+        self.result = None
+        self.busy = False
+
+
+    def to_move(self):
+        return Color.WHITE if self.board.black.bit_count() > self.board.white.bit_count() else Color.BLACK
+
+
+    def place(self, x, y, color):
+        self.board.place(x, y, color)
+        self.stones.append((x, y, color.value))
+        if self.board.is_five(color, x, y):
+            self.result = color.name
+        elif self.board.is_full():
+            self.result = "DRAW"
+
+
+    def move_time(self):
+        if self.time_left is None:
+            return self.time_limit
+        return max(min(self.time_limit, self.time_left / MOVES_LEFT), 0.0)
+
+
+    def state(self):
+        return {
+            "game": self.id,
+            "size": self.board.size,
+            "player": self.player_color.name,
+            "to_move": self.to_move().name,
+            "stones": [[x, y, Color(color).name] for x, y, color in self.stones],
+            "result": self.result,
+            "time_left": self.time_left,
+        }
+
+
+class GameServer:
+    # Hosts many games over one socket, a JSON request per line and a JSON
+    # reply per line. AI moves run in single-process engine pools. A game
+    # goes to its own worker, whose engine keeps the game's transposition
+    # table, unless that worker has more moves to search than another: then
+    # the move goes to the least loaded worker, which searches it without
+    # the table, rather than leaving a worker idle behind a slow one. The
+    # moves waiting for a worker form the queue, and once MAX_QUEUE are
+    # waiting, further ones are refused with "busy" instead of piling up.
+    def __init__(self, workers=None, max_queue=MAX_QUEUE, engine_options=None):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.max_queue = max_queue
+        self.engine_options = engine_options or {}
+        self.context = None
+        self.pools = []
+        self.slots = []
+        # moves waiting for or running in each worker
+        self.loads = [0] * self.workers
+        self.games = {}
+        self.game_ids = itertools.count(1)
+        self.waiting = 0
+        self.running = 0
+        self.moves = 0
+        self.refused = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.waits = deque(maxlen=LATENCY_WINDOW)
+
+
+    async def serve(self, host=HOST, port=PORT, path=None):
+        # spawn, like the search pool of Gomoku
+        self.context = multiprocessing.get_context("spawn")
+        self.pools = [ProcessPoolExecutor(1, mp_context=self.context) for _ in range(self.workers)]
+        self.slots = [asyncio.Semaphore(1) for _ in range(self.workers)]
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle_client, path)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for pool in self.pools:
+                pool.shutdown(cancel_futures=True)
+
+
+    async def handle_client(self, reader, writer):
+        # Requests on one connection are answered in order, so a client
+        # that does not read its replies stops being read from.
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = await self.handle_line(line)
+                writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+    async def handle_line(self, line):
+        request = {}
+        try:
+            request = json.loads(line)
+            reply = await self.handle(request)
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            reply = {"error": str(error)}
+        if isinstance(request, dict) and "id" in request:
+            reply["id"] = request["id"]
+        return reply
+
+
+    async def handle(self, request):
+        op = request["op"]
+        if op == "new":
+            return await self.new_game(request)
+        if op == "metrics":
+            return self.metrics()
+
+        game = self.games.get(request.get("game"))
+        if game is None:
+            return {"error": "unknown game"}
+        if op == "move":
+            return await self.player_move(game, int(request["x"]), int(request["y"]))
+        if op == "ai":
+            # asks again for an AI move that was refused as busy
+            if game.result is not None or game.busy or game.to_move() == game.player_color:
+                return {"error": "not the AI's move"}
+            return await self.ai_move(game)
+        if op == "state":
+            return game.state()
+        if op == "close":
+            del self.games[game.id]
+            return {"game": game.id, "closed": True}
+        return {"error": f"unknown op {op}"}
+
+
+    async def new_game(self, request):
+        size = int(request.get("size", BOARD_SIZE))
+        if not MIN_SIZE <= size <= MAX_SIZE:
+            return {"error": f"size must be from {MIN_SIZE} to {MAX_SIZE}"}
+        player = request.get("player", "BLACK")
+        if not isinstance(player, str) or player.upper() not in ("BLACK", "WHITE"):
+            return {"error": "player must be BLACK or WHITE"}
+        player_color = Color[player.upper()]
+        time_limit = min(float(request.get("time_limit", TIME_LIMIT)), MAX_TIME_LIMIT)
+        time_budget = request.get("time_budget")
+        # the board tables of a new size take a while to build
+        board = await asyncio.get_running_loop().run_in_executor(None, Bitboard, size)
+        game_id = next(self.game_ids)
+        game = GameSession(game_id, board, player_color, time_limit,
+                           None if time_budget is None else float(time_budget), game_id % self.workers)
+        if request.get("opening", True):
+            openings = [centered(opening, size) for opening in OPENINGS]
+            openings = [opening for opening in openings
+                        if all(0 <= x < size and 0 <= y < size for x, y, _ in opening)]
+            for x, y, color in random.choice(openings) if openings else []:
+                game.place(x, y, color)
+        self.games[game.id] = game
+
+        reply = {}
+        if game.to_move() != player_color:
+            reply = await self.ai_move(game)
+        return dict(game.state(), **reply)
+
+
+    async def player_move(self, game, x, y):
+        if game.result is not None:
+            return {"error": "game over", "result": game.result}
+        if game.busy or game.to_move() != game.player_color:
+            return {"error": "not your move"}
+        if not (0 <= x < game.board.size and 0 <= y < game.board.size) or not game.board.is_empty(x, y):
+            return {"error": "illegal move"}
+        game.place(x, y, game.player_color)
+        reply = {"game": game.id, "move": [x, y], "result": game.result}
+        if game.result is None:
+            reply.update(await self.ai_move(game))
+        return reply
+
+
+    async def ai_move(self, game):
+        if self.waiting >= self.max_queue:
+            self.refused += 1
+            return {"error": "busy"}
+        game.busy = True
+        worker = min(range(self.workers), key=lambda worker: (self.loads[worker], worker != game.worker))
+        start = time.perf_counter()
+        self.waiting += 1
+        self.loads[worker] += 1
+        try:
+            async with self.slots[worker]:
+                self.waiting -= 1
+                self.running += 1
+                started = time.perf_counter()
+                try:
+                    loop = asyncio.get_running_loop()
+                    result = await loop.run_in_executor(self.pools[worker], engine_move, game.id,
+                                                        game.board.size, list(game.stones), game.to_move().value,
+                                                        self.engine_options, game.move_time())
+                except BrokenProcessPool:
+                    # the worker died; its games start over in a new one
+                    self.pools[worker] = ProcessPoolExecutor(1, mp_context=self.context)
+                    result = {"error": "engine failed, try again"}
+                except Exception as error:
+                    result = {"error": f"engine failed: {error}"}
+                finally:
+                    self.running -= 1
+        finally:
+            self.loads[worker] -= 1
+            game.busy = False
+        elapsed = time.perf_counter() - start
+        self.waits.append(started - start)
+        self.latencies.append(elapsed)
+        if game.time_left is not None:
+            game.time_left = max(game.time_left - (time.perf_counter() - started), 0.0)
+
+        if "error" in result:
+            return {"error": result["error"]}
+        self.moves += 1
+        x, y = result["best_move"]
+        game.place(x, y, game.to_move())
+        return {"ai_move": [x, y], "result": game.result, "time_left": game.time_left}
+
+
+    def metrics(self):
+        return {
+            "games": len(self.games),
+            "workers": self.workers,
+            "queue_depth": self.waiting,
+            "running": self.running,
+            "ai_moves": self.moves,
+            "refused": self.refused,
+            "latency": summarize(self.latencies),
+            "queue_wait": summarize(self.waits),
+        }
+
+
+def summarize(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return {
+        "mean": sum(ordered) / len(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p90": ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))],
+        "p99": ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))],
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Host Gomoku games over a socket.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--unix", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=None, help="engine processes, one per CPU by default")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE)
+    parser.add_argument("--engine", default="minimax")
+    parser.add_argument("--max-depth", type=int, default=None)
+    parser.add_argument("--search-cache", default=None, help="search cache file shared by the engine processes")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    options = {"engine": args.engine, "multi_pv": 1, "search_cache": args.search_cache}
+    if args.max_depth is not None:
+        options["max_depth"] = args.max_depth
+    try:
+        asyncio.run(GameServer(args.workers, args.max_queue, options).serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,71 @@
+import cProfile
+import io
+import json
+import pstats
+
+# Sinks get start() before a search and finish(stats) after it. stats is
+# None when the search was cancelled before finishing depth 1.
+
+
+class LogSink:
+    def __init__(self, write=print):
+        self.write = write
+
+
+    def start(self):
+        pass
+
+
+    def finish(self, stats):
+        if stats is not None:
+            self.write(stats.summary())
+
+
+class JsonLinesSink:
+    def __init__(self, path):
+        self.path = path
+
+
+    def start(self):
+        pass
+
+
+    def finish(self, stats):
+        if stats is None:
+            return
+        with open(self.path, "a") as out:
+            out.write(json.dumps(stats.to_dict()) + "\n")
+
+
+class ProfileSink:
+    # Runs every search under cProfile and prints its busiest functions,
+    # or collects them all into one file with dump().
+    def __init__(self, limit=20, sort="cumulative", write=print):
+        self.limit = limit
+        self.sort = sort
+        self.write = write
+        self.profile = None
+        self.collected = None
+
+
+    def start(self):
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+
+    def finish(self, stats):
+        self.profile.disable()
+        if self.collected is None:
+            self.collected = pstats.Stats(self.profile)
+        else:
+            self.collected.add(self.profile)
+        if self.write is not None:
+            text = io.StringIO()
+            pstats.Stats(self.profile, stream=text).sort_stats(self.sort).print_stats(self.limit)
+            self.write(text.getvalue())
+        self.profile = None
+
+
+    def dump(self, path):
+        if self.collected is not None:
+            self.collected.dump_stats(path)
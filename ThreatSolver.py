@@ -0,0 +1,220 @@
+from Color import Color
+
+# Budgets per solve: nodes are attacker moves tried, depth counts attacker
+# moves along one line.
+VCF_NODE_LIMIT = 4000
+VCF_DEPTH = 12
+VCT_NODE_LIMIT = 1500
+VCT_DEPTH = 4
+
+
+class ThreatSolver:
+    # Threat-space search for forced wins: by continuous fours (VCF), where
+    # every defence is forced, and by fours and threes (VCT), where every
+    # cell of the threat and every counter-four is tried as a defence. It
+    # keeps, per color, the windows that hold only that color's stones,
+    # grouped by how many they hold, and updates them for the cells a move
+    # touches instead of rescanning the board. Stones are placed on the
+    # Bitboard itself and taken back before a solve returns.
+    def __init__(self, board):
+        self.board = board
+        self.windows = board.windows
+        self.cell_windows = board.cell_windows
+        self.counts = board.counts
+        self.levels = {Color.BLACK: [set() for _ in range(6)], Color.WHITE: [set() for _ in range(6)]}
+
+        # window count (black + 8 * white) -> the level set it belongs to
+        self.level_of = [None] * 46
+        for count in range(46):
+            black, white = count & 7, count >> 3
+            if white == 0 and 2 <= black <= 5:
+                self.level_of[count] = self.levels[Color.BLACK][black]
+            elif black == 0 and 2 <= white <= 5:
+                self.level_of[count] = self.levels[Color.WHITE][white]
+        for window in board.stone_windows(board.black | board.white):
+            level = self.level_of[self.counts[window]]
+            if level is not None:
+                level.add(window)
+        self.nodes = 0
+        self.limit = 0
+        self.failed = {}
+
+
+    def place(self, cell, color):
+        self.refile(cell, self.board.place, color)
+
+
+    def remove(self, cell):
+        self.refile(cell, self.board.remove)
+
+
+    def refile(self, cell, change, *color):
+        # Moves the windows through cell to their new level sets.
+        counts = self.counts
+        level_of = self.level_of
+        touched = self.cell_windows[cell]
+        for window in touched:
+            level = level_of[counts[window]]
+            if level is not None:
+                level.discard(window)
+        change(*self.board.cell(cell), *color)
+        for window in touched:
+            level = level_of[counts[window]]
+            if level is not None:
+                level.add(window)
+
+
+    def empty_cells(self, window):
+        stones = self.board.black | self.board.white
+        return [cell for cell in self.windows[window] if not stones >> cell & 1]
+
+
+    def five_points(self, color, windows=None):
+        # Cells where color completes exactly five, among the given windows.
+        mask = self.board.mask(color)
+        fours = self.levels[color][4]
+        points = set()
+        for window in fours if windows is None else windows:
+            if window in fours and not self.board.extends_window(mask, window):
+                points.update(self.empty_cells(window))
+        return points
+
+
+    def four_moves(self, color):
+        moves = set()
+        for window in self.levels[color][3]:
+            moves.update(self.empty_cells(window))
+        return sorted(moves)
+
+
+    def three_moves(self, color):
+        # Cells of two-stone windows, the ones shared by most windows first.
+        shared = {}
+        for window in self.levels[color][2]:
+            for cell in self.empty_cells(window):
+                shared[cell] = shared.get(cell, 0) + 1
+        return sorted(shared, key=lambda cell: (-shared[cell], cell))
+
+
+    def three_defences(self, color, cell):
+        # The empty cells of the three-stone windows through cell, if one of
+        # them can still become an open four; an empty list means the move
+        # threatens nothing.
+        threes = [window for window in self.cell_windows[cell] if window in self.levels[color][3]]
+        defences = set()
+        for window in threes:
+            defences.update(self.empty_cells(window))
+
+        for point in defences:
+            self.place(point, color)
+            open_four = len(self.five_points(color, self.cell_windows[point])) >= 2
+            self.remove(point)
+            if open_four:
+                return sorted(defences)
+        return []
+
+
+    def solve(self, color, vct=False):
+        # The first move of a forced win for color, who is to move, or None.
+        # Short wins are looked for first, so a win found once is found
+        # again on the next move with the budget left over.
+        self.limit = VCT_NODE_LIMIT if vct else VCF_NODE_LIMIT
+        self.nodes = 0
+        self.failed = {}
+        opponent = Color.WHITE if color == Color.BLACK else Color.BLACK
+        moves = self.attack_moves(color, opponent, vct) or ()
+        for depth in range(1, (VCT_DEPTH if vct else VCF_DEPTH) + 1):
+            for move in moves:
+                if self.try_attack(color, opponent, move, depth, vct):
+                    return self.board.cell(move)
+            if self.nodes >= self.limit:
+                break
+        return None
+
+
+    def attack_moves(self, color, opponent, vct):
+        # None when color cannot go on attacking: the opponent threatens two
+        # fives, or there is nothing left to try.
+        wins = self.five_points(color)
+        if wins:
+            return [min(wins)]
+        threats = self.five_points(opponent)
+        if len(threats) > 1:
+            return None
+        if threats:
+            return list(threats)
+        moves = self.four_moves(color)
+        if vct:
+            moves += [move for move in self.three_moves(color) if move not in moves]
+        return moves
+
+
+    def attack(self, color, opponent, depth, vct):
+        if self.five_points(color):
+            return True
+        if depth == 0 or self.nodes >= self.limit:
+            return False
+        key = self.board.hash
+        if self.failed.get(key, -1) >= depth:
+            return False
+
+        for move in self.attack_moves(color, opponent, vct) or ():
+            if self.try_attack(color, opponent, move, depth, vct):
+                return True
+        self.failed[key] = depth
+        return False
+
+
+    def try_attack(self, color, opponent, move, depth, vct):
+        self.nodes += 1
+        self.place(move, color)
+        try:
+            fives = self.five_points(color, self.cell_windows[move])
+            if self.board.is_five(color, *self.board.cell(move)):
+                return True
+            if len(fives) >= 2:
+                return True
+            if fives:
+                replies = list(fives)
+            elif vct:
+                replies = self.three_defences(color, move)
+                if not replies:
+                    return False
+                replies += [reply for reply in self.four_moves(opponent) if reply not in replies]
+            else:
+                return False
+
+            # Every defence has to lose.
+            for reply in replies:
+                self.place(reply, opponent)
+                try:
+                    if self.board.is_five(opponent, *self.board.cell(reply)):
+                        return False
+                    if not self.attack(color, opponent, depth - 1, vct):
+                        return False
+                finally:
+                    self.remove(reply)
+            return True
+        finally:
+            self.remove(move)
+
+
+    def defend(self, color):
+        # A move for color that leaves the opponent without a VCF, or None.
+        # The opponent's first move and the cells of its possible fours come
+        # first, then color's own fours.
+        opponent = Color.WHITE if color == Color.BLACK else Color.BLACK
+        attack = self.solve(opponent)
+        if attack is None:
+            return None
+        first = self.board.index(*attack)
+        candidates = [first] + [cell for cell in self.four_moves(opponent) + self.four_moves(color) if cell != first]
+        for cell in dict.fromkeys(candidates):
+            self.place(cell, color)
+            try:
+                refuted = self.solve(opponent) is None
+            finally:
+                self.remove(cell)
+            if refuted:
+                return self.board.cell(cell)
+        return None
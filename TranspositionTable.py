@@ -0,0 +1,48 @@
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+TT_SIZE = 1 << 18
+
+
+class TranspositionTable:
+    # Fixed number of slots indexed by key % size. A slot is taken over when it
+    # is empty, holds the same position, was written during an older search or
+    # holds a search that was not deeper than the new one.
+    def __init__(self, size=TT_SIZE):
+        self.size = size
+        self.clear()
+
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.generation = 0
+        self.hits = 0
+        self.stores = 0
+
+
+    def new_search(self):
+        self.generation += 1
+
+
+    def probe(self, key):
+        entry = self.entries[key % self.size]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+
+    def store(self, key, depth, flag, score, move):
+        slot = key % self.size
+        entry = self.entries[slot]
+        if entry is None or entry[0] == key or entry[5] != self.generation or depth >= entry[1]:
+            self.entries[slot] = (key, depth, flag, score, move, self.generation)
+            self.stores += 1
+
+
+    def best_move(self, key):
+        entry = self.probe(key)
+        if entry is None:
+            return None
+        return entry[4]